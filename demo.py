@@ -5,9 +5,9 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
+from src.scoring import fraud_score
 from src.streaming_features import RealTimeFeatureEngine
 from datetime import datetime, timezone
-import math
 
 def main():
     print('🛡️ Real-Time Fraud Detection System Demo')
@@ -53,16 +53,8 @@ def main():
         success = engine.process_event(event)
         features = engine.get_features(event['user_id'])
 
-        # Calculate fraud score
-        score = (
-            features.get('transaction_velocity_1h', 0) * 0.2 +
-            features.get('amount_zscore', 0) * 0.25 +
-            features.get('location_anomaly', 0) * 0.3 +
-            features.get('time_pattern_score', 0) * 0.15 +
-            -features.get('merchant_diversity', 0) * 0.05 +
-            -features.get('payment_method_consistency', 0) * 0.05
-        )
-        score = 1 / (1 + math.exp(-score))  # sigmoid
+        # Calculate fraud score with the same scorer as the API and UI
+        score = fraud_score(features)
 
         print('  {}. ${:.0f} at {} ({})'.format(
             i, event['amount'], event['merchant'], event['location']
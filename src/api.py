@@ -2,9 +2,11 @@
 
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
+import asyncio
 import time
 
+from .scoring import fraud_score
 from .streaming_features import RealTimeFeatureEngine
 from .utils.validation_utils import validate_event, sanitize_event
 from .utils.logging_utils import setup_logging
@@ -14,6 +16,9 @@ app = FastAPI(title="Real-Time Fraud Detection API", version="1.0.0")
 engine = RealTimeFeatureEngine()
 logger = setup_logging()
 
+# Upper bound on queued events for one user handled by a single engine call
+_MAX_BATCH_SIZE = 32
+
 
 class TransactionEvent(BaseModel):
     """Transaction event model."""
@@ -34,10 +39,92 @@ class FraudScoreResponse(BaseModel):
     processing_time_ms: float = Field(..., description="Processing time in milliseconds")
 
 
-@app.get("/health")
+class FeaturesResponse(BaseModel):
+    """User feature vector response model."""
+    user_id: str = Field(..., description="Unique user identifier")
+    features: Dict[str, Any] = Field(..., description="Feature vector")
+    timestamp: float = Field(..., description="Unix timestamp of the response")
+
+
+class HealthResponse(BaseModel):
+    """Health check response model."""
+    status: str = Field(..., description="Service status")
+    timestamp: float = Field(..., description="Unix timestamp of the response")
+    engine_stats: Dict[str, Any] = Field(..., description="State store statistics")
+
+
+# Resolves to a scoring request's features, or None if its event failed
+_FeaturesFuture = asyncio.Future[Optional[Dict[str, Any]]]
+
+
+class UserBatcher:
+    """Coalesces concurrent scoring requests for the same user.
+
+    Requests are queued per user and drained by a single task per user, so a
+    user's events are processed in arrival order without a separate lock. Each
+    drain hands up to ``max_batch_size`` events to the engine in one call on a
+    worker thread, keeping feature computation off the event loop. Every
+    request still gets the features as of its own event, not the batch's last.
+    """
+
+    def __init__(self, engine: RealTimeFeatureEngine, max_batch_size: int = _MAX_BATCH_SIZE):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, List[Tuple[Dict[str, Any], _FeaturesFuture]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Queue an event and wait for its user's features right after it (None on failure)."""
+        user_id = event['user_id']
+        future: _FeaturesFuture = asyncio.get_running_loop().create_future()
+
+        pending = self._pending.get(user_id)
+        if pending is None:
+            self._pending[user_id] = [(event, future)]
+            task = asyncio.create_task(self._drain(user_id))
+            # Hold a reference so the task isn't garbage collected mid-drain
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            pending.append((event, future))
+
+        return await future
+
+    async def _drain(self, user_id: str) -> None:
+        """Process queued events for a user until the queue is empty."""
+        pending = self._pending[user_id]
+        try:
+            while pending:
+                batch = pending[:self.max_batch_size]
+                del pending[:self.max_batch_size]
+
+                try:
+                    results = await asyncio.to_thread(
+                        self.engine.process_sequence, [event for event, _ in batch]
+                    )
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for (_, future), features in zip(batch, results):
+                    if not future.done():
+                        future.set_result(features)
+        finally:
+            del self._pending[user_id]
+
+
+batcher = UserBatcher(engine)
+
+
+# Endpoints return plain dicts: FastAPI validates them against the response
+# model once and serializes straight to JSON bytes through Pydantic.
+
+@app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint."""
-    stats = engine.state_store.get_stats()
+    stats = await asyncio.to_thread(engine.get_stats)
     return {
         "status": "healthy",
         "timestamp": time.time(),
@@ -51,8 +138,8 @@ async def calculate_fraud_score(event: TransactionEvent, request: Request):
     start_time = time.time()
 
     try:
-        # Convert to dict and validate
-        event_dict = event.dict()
+        # Convert to dict (omitted optional fields left out) and validate
+        event_dict = event.model_dump(exclude_none=True)
         is_valid, error_msg = validate_event(event_dict)
 
         if not is_valid:
@@ -61,17 +148,15 @@ async def calculate_fraud_score(event: TransactionEvent, request: Request):
         # Sanitize event
         sanitized_event = sanitize_event(event_dict)
 
-        # Process event through engine
-        success = engine.process_event(sanitized_event)
-        if not success:
+        # Process event through engine, batched with concurrent requests for the user
+        features = await batcher.submit(sanitized_event)
+        if features is None:
             raise HTTPException(status_code=500, detail="Failed to process event")
 
-        # Get updated features
         user_id = sanitized_event['user_id']
-        features = engine.get_features(user_id)
 
         # Calculate fraud score using weighted features
-        score = _calculate_fraud_score(features)
+        score = fraud_score(features)
 
         processing_time = (time.time() - start_time) * 1000
 
@@ -80,12 +165,12 @@ async def calculate_fraud_score(event: TransactionEvent, request: Request):
             f"score={score:.3f}, processing_time={processing_time:.2f}ms"
         )
 
-        return FraudScoreResponse(
-            score=score,
-            features=features,
-            model_version="v0",
-            processing_time_ms=processing_time
-        )
+        return {
+            "score": score,
+            "features": features,
+            "model_version": "v0",
+            "processing_time_ms": processing_time
+        }
 
     except HTTPException:
         raise
@@ -94,36 +179,11 @@ async def calculate_fraud_score(event: TransactionEvent, request: Request):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-def _calculate_fraud_score(features: Dict[str, Any]) -> float:
-    """Calculate fraud score using weighted feature combination."""
-    # Weights for different features (tuned for demo purposes)
-    weights = {
-        'transaction_velocity_1h': 0.2,      # High velocity is suspicious
-        'amount_zscore': 0.25,               # Unusual amounts are suspicious
-        'location_anomaly': 0.3,             # Location changes are suspicious
-        'time_pattern_score': 0.15,          # Unusual timing is suspicious
-        'merchant_diversity': -0.05,         # More diverse merchants = less suspicious
-        'payment_method_consistency': -0.05  # Consistent payment methods = less suspicious
-    }
-
-    score = 0.0
-
-    for feature, weight in weights.items():
-        value = features.get(feature, 0.0)
-        score += value * weight
-
-    # Apply sigmoid transformation to bound between 0 and 1
-    import math
-    score = 1 / (1 + math.exp(-score))
-
-    return min(max(score, 0.0), 1.0)
-
-
-@app.get("/features/{user_id}")
+@app.get("/features/{user_id}", response_model=FeaturesResponse)
 async def get_user_features(user_id: str):
     """Get current feature vector for a user."""
     try:
-        features = engine.get_features(user_id)
+        features = await asyncio.to_thread(engine.get_features, user_id)
         return {
             "user_id": user_id,
             "features": features,
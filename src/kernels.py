@@ -0,0 +1,55 @@
+"""Scalar feature formulas for the feature engine, computed from window aggregates."""
+
+from typing import Tuple
+
+
+def amount_features(count: int, mean: float, m2: float, recent_amount: float) -> Tuple[float, float]:
+    """Z-score and volatility of the recent amount from historical (count, mean, M2)."""
+    if count < 1:
+        return 0.0, 0.0
+
+    if count == 1:
+        # If only one historical amount, use a small default std dev
+        std = abs(mean) * 0.1 if mean != 0 else 1.0
+    else:
+        std = (m2 / (count - 1)) ** 0.5
+        # If std dev is zero, use a minimum threshold
+        if std == 0:
+            std = abs(mean) * 0.1 if mean != 0 else 1.0
+
+    zscore = (recent_amount - mean) / std
+
+    # Amount volatility (coefficient of variation)
+    volatility = std / mean if mean > 0 else 0.0
+    return zscore, volatility
+
+
+def location_features(recent_count: int, primary_count: int, total: int) -> Tuple[int, float]:
+    """Location anomaly flag and consistency from location counts."""
+    if total == 0:
+        return 0, 1.0
+
+    # Anomaly if this location appears in <= 10% of transactions
+    anomaly = 1 if recent_count / total <= 0.1 and total > 5 else 0
+
+    # Location consistency (ratio of primary location)
+    consistency = primary_count / total
+    return anomaly, consistency
+
+
+def time_pattern_score(hour_count: int, weekday_count: int, total_historical: int) -> float:
+    """Score how unusual the recent hour/weekday is versus history (higher = rarer)."""
+    if total_historical <= 0:
+        return 0.0
+
+    hour_freq = hour_count / total_historical
+    weekday_freq = weekday_count / total_historical
+    return 1.0 - (hour_freq + weekday_freq) / 2
+
+
+def behavioral_features(unique_merchants: int, total_transactions: int,
+                        primary_method_count: int, total_methods: int) -> Tuple[float, float]:
+    """Merchant diversity and payment method consistency from counts."""
+    merchant_diversity = unique_merchants / total_transactions if total_transactions > 0 else 0.0
+    payment_consistency = primary_method_count / total_methods if total_methods > 0 else 1.0
+    return merchant_diversity, payment_consistency
@@ -0,0 +1,64 @@
+"""Fraud scoring from feature vectors: a weighted sum squashed through a sigmoid.
+
+The sigmoid is evaluated as 0.5 * (1 + tanh(x / 2)), which saturates to 0 or
+1 on its own, so large scores need neither clamping nor overflow handling.
+"""
+
+from math import tanh
+from typing import Any, Callable, Dict, Iterable
+
+import numpy as np
+
+
+# Weights for different features (tuned for demo purposes)
+FEATURE_WEIGHTS = (
+    ('transaction_velocity_1h', 0.2),      # High velocity is suspicious
+    ('amount_zscore', 0.25),               # Unusual amounts are suspicious
+    ('location_anomaly', 0.3),             # Location changes are suspicious
+    ('time_pattern_score', 0.15),          # Unusual timing is suspicious
+    ('merchant_diversity', -0.05),         # More diverse merchants = less suspicious
+    ('payment_method_consistency', -0.05)  # Consistent payment methods = less suspicious
+)
+
+# Column order of feature matrices passed to fraud_scores()
+FEATURE_ORDER = tuple(name for name, _ in FEATURE_WEIGHTS)
+WEIGHTS = np.array([weight for _, weight in FEATURE_WEIGHTS], dtype=np.float64)
+
+
+def _compile_fraud_score() -> Callable[[Dict[str, Any]], float]:
+    """Generate the scalar scorer with FEATURE_WEIGHTS inlined as constants.
+
+    Unrolling the weighted sum removes the loop and tuple unpacking per
+    feature. Callers hold feature dicts, and packing one into an array costs
+    more than the whole scalar sum, so this also beats NumPy or a compiled
+    kernel for a single six-element vector.
+    """
+    terms = ' + '.join(f'get({name!r}, 0.0) * {weight!r}' for name, weight in FEATURE_WEIGHTS)
+    source = (
+        'def fraud_score(features):\n'
+        '    get = features.get\n'
+        f'    score = {terms}\n'
+        '    # Apply sigmoid transformation to bound between 0 and 1\n'
+        '    return 0.5 * (1.0 + tanh(0.5 * score))\n'
+    )
+    namespace: Dict[str, Any] = {'tanh': tanh}
+    exec(compile(source, '<fraud_score>', 'exec'), namespace)
+
+    scorer: Callable[[Dict[str, Any]], float] = namespace['fraud_score']
+    scorer.__doc__ = "Calculate fraud score using weighted feature combination."
+    scorer.__module__ = __name__
+    return scorer
+
+
+fraud_score = _compile_fraud_score()
+
+
+def feature_matrix(feature_dicts: Iterable[Dict[str, Any]]) -> np.ndarray:
+    """Stack feature dicts into an (n, len(FEATURE_ORDER)) matrix, missing features as 0."""
+    rows = [[features.get(name, 0.0) for name in FEATURE_ORDER] for features in feature_dicts]
+    return np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_ORDER))
+
+
+def fraud_scores(features: np.ndarray) -> np.ndarray:
+    """Score every row of a feature matrix (columns in FEATURE_ORDER) at once."""
+    return 0.5 * (1.0 + np.tanh(0.5 * (features @ WEIGHTS)))
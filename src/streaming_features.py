@@ -1,18 +1,34 @@
 """Real-time feature engineering engine for fraud detection."""
 
-import statistics
-from collections import defaultdict
+import threading
+from types import MappingProxyType
 from typing import Dict, Any, List, Optional
 
-from .utils.state_store import StateStore
+import numpy as np
+
+from . import kernels
+from .scoring import FEATURE_ORDER
+from .utils.state_store import StateStore, WindowAggregate
 from .utils.time_utils import (
-    is_within_window, get_time_features, calculate_time_diff_minutes,
-    get_hour_window
+    is_within_window, calculate_time_diff_minutes, get_hour_window, parse_timestamp
 )
 from .utils.validation_utils import validate_feature_vector
 from .utils.logging_utils import setup_logging
 
 
+# Values reported for features that haven't been computed for a user
+_DEFAULT_FEATURES = MappingProxyType({
+    'transaction_velocity_1h': 0.0,
+    'amount_zscore': 0.0,
+    'location_anomaly': 0,
+    'time_pattern_score': 0.0,
+    'merchant_diversity': 0.0,
+    'payment_method_consistency': 1.0,
+    'amount_volatility': 0.0,
+    'location_consistency': 1.0
+})
+
+
 class RealTimeFeatureEngine:
     """Real-time feature engineering engine for fraud detection."""
 
@@ -20,6 +36,9 @@ class RealTimeFeatureEngine:
         self.state_store = state_store or StateStore()
         self.logger = setup_logging()
 
+        # Serializes state access when the engine is driven from worker threads
+        self._lock = threading.Lock()
+
         # Feature configuration
         self.velocity_window_hours = 1
         self.amount_history_window_hours = 24
@@ -28,25 +47,12 @@ class RealTimeFeatureEngine:
     def process_event(self, event: Dict[str, Any]) -> bool:
         """Process a transaction event and update user features."""
         try:
-            # Ensure event has timestamp_unix field
-            if 'timestamp_unix' not in event and 'timestamp' in event:
-                from .utils.time_utils import parse_timestamp
-                event = event.copy()  # Don't modify original
-                event['timestamp_unix'] = parse_timestamp(event['timestamp'])
-
-            # Update user's event history
-            user_id = event['user_id']
-            self.state_store.update_user_events(user_id, event)
-
-            # Calculate and update features
-            features = self._calculate_features(user_id)
-            self.state_store.update_user_features(user_id, features)
-
-            # Periodic cleanup
-            if self.state_store.should_cleanup():
-                cleared = self.state_store.clear_old_entries()
-                if cleared > 0:
-                    self.logger.info(f"Cleared {cleared} old user entries")
+            with self._lock:
+                user_id = event['user_id']
+                if self._store_events(user_id, [event]):
+                    # Calculate and update features
+                    self._refresh_features(user_id)
+                self._maybe_cleanup()
 
             return True
 
@@ -54,198 +60,214 @@ class RealTimeFeatureEngine:
             self.logger.error(f"Failed to process event: {e}")
             return False
 
+    def process_batch(self, events: List[Dict[str, Any]]) -> bool:
+        """Process several events, recomputing features once per affected user.
+
+        Events are grouped by user (keeping arrival order) and each user's
+        events are stored in one pass, column-wise for large groups. Features
+        reflect the state after the whole batch, with the last event of each
+        user as the one being scored.
+        """
+        try:
+            with self._lock:
+                events_by_user: Dict[str, List[Dict[str, Any]]] = {}
+                for event in events:
+                    events_by_user.setdefault(event['user_id'], []).append(event)
+
+                for user_id, user_events in events_by_user.items():
+                    if self._store_events(user_id, user_events):
+                        self._refresh_features(user_id)
+                self._maybe_cleanup()
+
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Failed to process batch of {len(events)} events: {e}")
+            return False
+
+    def process_events(self, events: List[Dict[str, Any]]) -> np.ndarray:
+        """Process events one after another, returning each event's features.
+
+        Row i holds the features of event i's user right after that event, in
+        scoring.FEATURE_ORDER columns, ready for scoring.fraud_scores(). Rows
+        of events that fail to process keep the default features.
+        """
+        default_row = np.array([_DEFAULT_FEATURES[name] for name in FEATURE_ORDER], dtype=np.float64)
+        matrix = np.tile(default_row, (len(events), 1))
+
+        for i, features in enumerate(self.process_sequence(events)):
+            if features is not None:
+                matrix[i] = [features[name] for name in FEATURE_ORDER]
+
+        return matrix
+
+    def process_sequence(self, events: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Process events one after another under a single lock acquisition.
+
+        Returns each event's full feature vector as of right after that event,
+        exactly as process_event() followed by get_features() would, or None
+        for events that fail to process.
+        """
+        results: List[Optional[Dict[str, Any]]] = []
+
+        with self._lock:
+            for event in events:
+                try:
+                    user_id = event['user_id']
+                    if self._store_events(user_id, [event]):
+                        self._refresh_features(user_id)
+                    results.append(self._current_features(user_id))
+                except Exception as e:
+                    self.logger.error(f"Failed to process event: {e}")
+                    results.append(None)
+            self._maybe_cleanup()
+
+        return results
+
     def get_features(self, user_id: str) -> Dict[str, Any]:
         """Get latest feature vector for user."""
+        with self._lock:
+            return self._current_features(user_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get state store statistics."""
+        with self._lock:
+            return self.state_store.get_stats()
+
+    def _current_features(self, user_id: str) -> Dict[str, Any]:
+        """Get the user's up-to-date features, with defaults for any missing."""
+        if self.state_store.features_outdated(user_id):
+            self._refresh_features(user_id)
         features = self.state_store.get_user_features(user_id)
 
-        # Ensure all required features are present with defaults
-        default_features = {
-            'transaction_velocity_1h': 0.0,
-            'amount_zscore': 0.0,
-            'location_anomaly': 0,
-            'time_pattern_score': 0.0,
-            'merchant_diversity': 0.0,
-            'payment_method_consistency': 1.0,
-            'amount_volatility': 0.0,
-            'location_consistency': 1.0
-        }
+        # The stored vector is shared, so only build a new dict when defaults are missing
+        if _DEFAULT_FEATURES.keys() <= features.keys():
+            return features
+        return {**_DEFAULT_FEATURES, **features}
 
-        # Merge with existing features
-        for key, default_value in default_features.items():
-            if key not in features:
-                features[key] = default_value
+    def _store_events(self, user_id: str, events: List[Dict[str, Any]]) -> bool:
+        """Add a user's events to their history, skipping duplicates.
 
-        return features
+        Returns whether any event was new.
+        """
+        new_events = []
+        seen = set()
+        for event in events:
+            # Replayed/retried transactions must not be counted twice
+            transaction_id = event.get('transaction_id')
+            if transaction_id is not None:
+                if transaction_id in seen or self.state_store.has_transaction(user_id, transaction_id):
+                    self.logger.debug(f"Skipping duplicate transaction {transaction_id}")
+                    continue
+                seen.add(transaction_id)
+
+            # Ensure event has timestamp_unix field (sanitize_event already sets it);
+            # integer nanosecond timestamps in 'ts_ns' are used without any parsing
+            if 'timestamp_unix' not in event:
+                if 'ts_ns' in event:
+                    event = {**event, 'timestamp_unix': event['ts_ns'] / 1e9}
+                elif 'timestamp' in event:
+                    event = event.copy()  # Don't modify original
+                    event['timestamp_unix'] = parse_timestamp(event['timestamp'])
+            new_events.append(event)
+
+        if not new_events:
+            return False
+
+        # Update user's event history
+        self.state_store.update_user_events_batch(user_id, new_events)
+        return True
+
+    def _maybe_cleanup(self) -> None:
+        """Run periodic cleanup of stale users when due."""
+        if self.state_store.should_cleanup():
+            cleared = self.state_store.clear_old_entries()
+            if cleared > 0:
+                self.logger.info(f"Cleared {cleared} old user entries")
+
+    def _refresh_features(self, user_id: str) -> None:
+        """Recompute and store features for a user with new events."""
+        features = self._calculate_features(user_id)
+        self.state_store.update_user_features(user_id, features)
 
     def _calculate_features(self, user_id: str) -> Dict[str, Any]:
         """Calculate all features for a user."""
         features = {}
 
-        # Get recent events
-        recent_events_1h = self.state_store.get_recent_events(user_id, 60)  # 1 hour
-        recent_events_24h = self.state_store.get_recent_events(user_id, 1440)  # 24 hours
-        recent_events_1w = self.state_store.get_recent_events(user_id, 10080)  # 1 week
+        # Get incrementally maintained window aggregates
+        window_1h = self.state_store.get_window(user_id, self.velocity_window_hours * 60)
+        window_24h = self.state_store.get_window(user_id, self.amount_history_window_hours * 60)
+        window_1w = self.state_store.get_window(user_id, self.location_history_window_hours * 60)
 
         # Transaction velocity (transactions per hour in last hour)
-        features['transaction_velocity_1h'] = len(recent_events_1h)
+        features['transaction_velocity_1h'] = window_1h.count if window_1h else 0
 
         # Amount-based features
-        if recent_events_24h:
-            features.update(self._calculate_amount_features(recent_events_24h))
+        if window_24h and window_24h.count:
+            features.update(self._calculate_amount_features(window_24h))
 
         # Location-based features
-        if recent_events_1w:
-            features.update(self._calculate_location_features(recent_events_1w))
+        if window_1w and window_1w.count:
+            features.update(self._calculate_location_features(window_1w))
 
         # Time-based features
-        if recent_events_1w:
-            features.update(self._calculate_time_features(recent_events_1w))
+        if window_1w and window_1w.count:
+            features.update(self._calculate_time_features(window_1w))
 
         # Merchant and payment method diversity
-        if recent_events_1w:
-            features.update(self._calculate_behavioral_features(recent_events_1w))
+        if window_1w and window_1w.count:
+            features.update(self._calculate_behavioral_features(window_1w))
 
         return features
 
-    def _calculate_amount_features(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _calculate_amount_features(self, window: WindowAggregate) -> Dict[str, Any]:
         """Calculate amount-related features."""
-        amounts = [e.get('amount', 0) for e in events]
-
-        if len(amounts) < 2:
-            return {
-                'amount_zscore': 0.0,
-                'amount_volatility': 0.0
-            }
-
-        # Calculate z-score for the most recent amount
-        recent_amount = amounts[-1]
-        historical_amounts = amounts[:-1]
-
-        if not historical_amounts:
-            return {
-                'amount_zscore': 0.0,
-                'amount_volatility': 0.0
-            }
-
-        mean_amount = statistics.mean(historical_amounts)
-
-        # Handle case where all historical amounts are the same
-        if len(historical_amounts) == 1:
-            # If only one historical amount, use a small default std dev
-            std_amount = abs(mean_amount) * 0.1 if mean_amount != 0 else 1.0
-        else:
-            try:
-                std_amount = statistics.stdev(historical_amounts)
-                # If std dev is very small or zero, use a minimum threshold
-                if std_amount == 0:
-                    std_amount = abs(mean_amount) * 0.1 if mean_amount != 0 else 1.0
-            except statistics.StatisticsError:
-                std_amount = abs(mean_amount) * 0.1 if mean_amount != 0 else 1.0
-
-        zscore = (recent_amount - mean_amount) / std_amount
-
-        # Amount volatility (coefficient of variation)
-        volatility = std_amount / mean_amount if mean_amount > 0 else 0
+        # Z-score of the most recent amount against the rest of the window
+        count, mean_amount, m2 = window.historical_amount_stats()
+        zscore, volatility = kernels.amount_features(count, mean_amount, m2, window.recent_amount)
 
         return {
             'amount_zscore': zscore,
             'amount_volatility': volatility
         }
 
-    def _calculate_location_features(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _calculate_location_features(self, window: WindowAggregate) -> Dict[str, Any]:
         """Calculate location-based features."""
-        locations = [e.get('location', '') for e in events if e.get('location')]
-        recent_location = events[-1].get('location', '') if events else ''
-
-        if not locations:
-            return {
-                'location_anomaly': 0,
-                'location_consistency': 1.0
-            }
+        location_counts = window.locations
 
-        # Simple anomaly detection: flag if recent location is rare
-        location_counts = defaultdict(int)
-        for loc in locations:
-            location_counts[loc] += 1
-
-        total_locations = len(locations)
-        recent_count = location_counts.get(recent_location, 0)
-
-        # Anomaly if this location appears in <= 10% of transactions
-        anomaly = 1 if recent_count / total_locations <= 0.1 and total_locations > 5 else 0
-
-        # Location consistency (ratio of primary location)
-        primary_location_count = max(location_counts.values()) if location_counts else 0
-        consistency = primary_location_count / total_locations if total_locations > 0 else 1.0
+        # Flag rare recent locations; consistency is the primary location's share
+        anomaly, consistency = kernels.location_features(
+            location_counts.get(window.recent_location_id, 0),
+            max(location_counts.values(), default=0),
+            location_counts.total()
+        )
 
         return {
             'location_anomaly': anomaly,
             'location_consistency': consistency
         }
 
-    def _calculate_time_features(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _calculate_time_features(self, window: WindowAggregate) -> Dict[str, Any]:
         """Calculate time-based features."""
-        if not events:
-            return {'time_pattern_score': 0.0}
-
-        # Analyze transaction timing patterns
-        hours = []
-        weekdays = []
-
-        for event in events:
-            timestamp = event.get('timestamp_unix', 0)
-            if timestamp > 0:
-                time_features = get_time_features(timestamp)
-                hours.append(time_features['hour_of_day'])
-                weekdays.append(time_features['day_of_week'])
-
-        if not hours:
-            return {'time_pattern_score': 0.0}
-
-        # Calculate pattern deviation
         # Score based on how unusual the recent transaction time is
-        recent_hour = hours[-1]
-        recent_weekday = weekdays[-1] if weekdays else 0
-
-        hour_counts = defaultdict(int)
-        weekday_counts = defaultdict(int)
-
-        for h, w in zip(hours[:-1], weekdays[:-1]) if len(hours) > 1 else []:
-            hour_counts[h] += 1
-            weekday_counts[w] += 1
-
-        # Pattern score: higher for unusual timing
-        total_historical = len(hours) - 1
-        if total_historical > 0:
-            recent_hour_freq = hour_counts.get(recent_hour, 0) / total_historical
-            recent_weekday_freq = weekday_counts.get(recent_weekday, 0) / total_historical
-
-            # Unusual timing gets higher score
-            pattern_score = 1.0 - (recent_hour_freq + recent_weekday_freq) / 2
-        else:
-            pattern_score = 0.0
+        pattern_score = kernels.time_pattern_score(
+            window.hour_counts[window.recent_hour],
+            window.weekday_counts[window.recent_weekday],
+            window.count - 1
+        )
 
         return {'time_pattern_score': pattern_score}
 
-    def _calculate_behavioral_features(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _calculate_behavioral_features(self, window: WindowAggregate) -> Dict[str, Any]:
         """Calculate merchant and payment method diversity features."""
-        merchants = [e.get('merchant', '') for e in events if e.get('merchant')]
-        payment_methods = [e.get('payment_method', '') for e in events if e.get('payment_method')]
-
-        # Merchant diversity (unique merchants / total transactions)
-        unique_merchants = len(set(merchants)) if merchants else 0
-        total_transactions = len(events)
-        merchant_diversity = unique_merchants / total_transactions if total_transactions > 0 else 0
-
-        # Payment method consistency
-        if payment_methods:
-            method_counts = defaultdict(int)
-            for method in payment_methods:
-                method_counts[method] += 1
-            primary_method_count = max(method_counts.values())
-            payment_consistency = primary_method_count / len(payment_methods)
-        else:
-            payment_consistency = 1.0
+        # Merchant diversity (unique merchants / total transactions) and
+        # payment method consistency (share of the primary method)
+        merchant_diversity, payment_consistency = kernels.behavioral_features(
+            len(window.merchants),
+            window.count,
+            max(window.payment_methods.values(), default=0),
+            window.payment_methods.total()
+        )
 
         return {
             'merchant_diversity': merchant_diversity,
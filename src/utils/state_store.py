@@ -1,16 +1,591 @@
 """Simple in-memory state store for real-time features with TTL support."""
 
+import heapq
 import time
-from collections import deque, defaultdict
-from typing import Dict, List, Any, Optional
+from collections import Counter
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 
+import numpy as np
 
-@dataclass
+from .time_utils import get_hour_and_weekday, to_iso_timestamp
+
+
+# Sliding windows (in minutes) maintained incrementally for every user
+DEFAULT_WINDOW_MINUTES = (60, 1440, 10080)  # 1 hour, 24 hours, 1 week
+
+# Most recent events retained per user
+MAX_EVENTS_PER_USER = 1000
+
+# Rows allocated for a new user; columns grow geometrically from here
+_INITIAL_CAPACITY = 8
+
+# Rows per shared arena page (pages are never resized once allocated)
+_ARENA_PAGE_ROWS = 1 << 16
+
+# Past this many evictions in one go, rebuild a window from its remaining events
+_BULK_EVICT_THRESHOLD = 32
+
+# Batches of at least this many events for one user are stored column-wise
+_BULK_APPEND_THRESHOLD = 32
+
+# Rebuild the expiry heap once superseded entries outnumber users this many times over
+_EXPIRY_HEAP_SLACK = 4
+
+# Per-event NumPy columns of an EventBuffer
+_COLUMNS = (
+    ('amounts', np.float64),
+    ('timestamps', np.float64),
+    ('hours', np.int8),
+    ('weekdays', np.int8),
+    ('location_ids', np.int32),
+    ('merchant_ids', np.int32),
+    ('payment_ids', np.int32),
+    ('window_mask', np.uint32),  # Bit i set if the event entered window i
+    ('transaction_ids', object),
+)
+
+# Categorical event fields and the EventBuffer column holding their ids
+_CATEGORICAL_FIELDS = (
+    ('merchant', 'merchant_ids'),
+    ('location', 'location_ids'),
+    ('payment_method', 'payment_ids'),
+)
+
+
+def _increment(counter: Counter, key: int) -> None:
+    """Count a categorical id, ignoring the missing-value id 0."""
+    if key:
+        counter[key] += 1
+
+
+def _count_ids(ids: np.ndarray) -> Counter:
+    """Count vocabulary ids in bulk, skipping missing values like _increment."""
+    counts = Counter(ids.tolist())
+    counts.pop(0, None)
+    return counts
+
+
+def _decrement(counter: Counter, key: int) -> None:
+    """Un-count a categorical id, dropping keys that reach zero."""
+    if key:
+        remaining = counter[key] - 1
+        if remaining > 0:
+            counter[key] = remaining
+        else:
+            del counter[key]
+
+
+class Vocabulary:
+    """Interns categorical strings as dense integer ids.
+
+    Id 0 is reserved for missing/empty values. Ids are never recycled, so
+    the vocabulary grows with the number of distinct values ever seen.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._values: List[str] = ['']
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def encode(self, value: Optional[str]) -> int:
+        """Get the id for a value, assigning a new one on first sight."""
+        if not value:
+            return 0
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self._values)
+            self._values.append(value)
+        return value_id
+
+    def decode(self, value_id: int) -> str:
+        """Get the value for an id ('' for missing)."""
+        return self._values[value_id]
+
+
+class _ArenaPage:
+    """One fixed-size set of event columns inside an EventArena."""
+
+    __slots__ = tuple(name for name, _ in _COLUMNS)
+
+    # Columns, one per _COLUMNS entry
+    amounts: np.ndarray
+    timestamps: np.ndarray
+    hours: np.ndarray
+    weekdays: np.ndarray
+    location_ids: np.ndarray
+    merchant_ids: np.ndarray
+    payment_ids: np.ndarray
+    window_mask: np.ndarray
+    transaction_ids: np.ndarray
+
+    def __init__(self, rows: int):
+        for name, dtype in _COLUMNS:
+            setattr(self, name, np.zeros(rows, dtype=dtype))
+
+
+class EventArena:
+    """Event columns shared by many users' EventBuffers.
+
+    A handful of NumPy arrays per user costs far more than the few events
+    most users have, so buffers instead take row blocks out of large shared
+    pages. Freed blocks are kept per size and reused. Pages are never
+    resized, so buffers can hold direct references to their page's columns.
+    """
+
+    def __init__(self, page_rows: int = _ARENA_PAGE_ROWS):
+        self.page_rows = page_rows
+        self.pages: List[_ArenaPage] = []
+        self._free: Dict[int, List[Tuple[_ArenaPage, int]]] = {}
+        self._page_used = 0  # Rows handed out from the newest page
+
+    def allocate(self, rows: int) -> Tuple[_ArenaPage, int]:
+        """Get a block of rows as (page, offset of its first row)."""
+        free = self._free.get(rows)
+        if free:
+            return free.pop()
+
+        if not self.pages or self._page_used + rows > len(self.pages[-1].amounts):
+            self.pages.append(_ArenaPage(max(self.page_rows, rows)))
+            self._page_used = 0
+
+        offset = self._page_used
+        self._page_used += rows
+        return self.pages[-1], offset
+
+    def release(self, page: _ArenaPage, offset: int, rows: int) -> None:
+        """Return a block for reuse."""
+        page.transaction_ids[offset:offset + rows] = None
+        self._free.setdefault(rows, []).append((page, offset))
+
+    @property
+    def allocated_rows(self) -> int:
+        """Total rows across all pages."""
+        return sum(len(page.amounts) for page in self.pages)
+
+
+class EventBuffer:
+    """Structure-of-arrays storage for a user's most recent events.
+
+    Each event field lives in its own NumPy column, a block of rows in a
+    (possibly shared) EventArena page. Events are addressed by monotonically
+    increasing sequence numbers; live events occupy the contiguous rows for
+    sequence numbers [start, end), with row = seq - base indexing the page
+    columns directly. Blocks grow geometrically up to twice ``max_events``
+    and are compacted once full, so appends are amortized O(1).
+    """
+
+    __slots__ = (
+        'max_events', 'arena', 'page', 'offset', 'capacity',
+        'base', 'start', 'end', 'last_disorder', '_live_transaction_ids'
+    ) + tuple(name for name, _ in _COLUMNS)
+
+    # Views into the page columns, one per _COLUMNS entry
+    amounts: np.ndarray
+    timestamps: np.ndarray
+    hours: np.ndarray
+    weekdays: np.ndarray
+    location_ids: np.ndarray
+    merchant_ids: np.ndarray
+    payment_ids: np.ndarray
+    window_mask: np.ndarray
+    transaction_ids: np.ndarray
+
+    def __init__(self, max_events: int = MAX_EVENTS_PER_USER,
+                 arena: Optional[EventArena] = None):
+        self.max_events = max_events
+        # Standalone buffers get a private arena sized to their own blocks
+        self.arena = arena if arena is not None else EventArena(page_rows=0)
+        self.page: Optional[_ArenaPage] = None
+        self.offset = 0    # First row of this buffer's block in the page
+        self.capacity = 0  # Rows in this buffer's block
+        self.base = 0   # Sequence number at page row 0 (seq - base is the row)
+        self.start = 0  # Sequence number of the oldest live event
+        self.end = 0    # Sequence number the next event will get
+        self.last_disorder = -1  # Latest sequence number that arrived out of timestamp order
+        self._live_transaction_ids: set = set()
+        self._resize(min(_INITIAL_CAPACITY, max_events))
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __contains__(self, transaction_id: str) -> bool:
+        """Whether a live event has this transaction id."""
+        return transaction_id in self._live_transaction_ids
+
+    @property
+    def is_sorted(self) -> bool:
+        """Whether live timestamps are non-decreasing in arrival order."""
+        return self.last_disorder <= self.start
+
+    def append(self, transaction_id: Optional[str], amount: float, timestamp: float,
+               hour: int, weekday: int, location_id: int, merchant_id: int,
+               payment_id: int) -> int:
+        """Store a new event and return its sequence number."""
+        row = self.end - self.base
+        if row == self.offset + self.capacity:
+            self._reserve(1)
+            row = self.end - self.base
+
+        if len(self) and timestamp < self.timestamps.item(row - 1):
+            self.last_disorder = self.end
+
+        self.amounts[row] = amount
+        self.timestamps[row] = timestamp
+        self.hours[row] = hour
+        self.weekdays[row] = weekday
+        self.location_ids[row] = location_id
+        self.merchant_ids[row] = merchant_id
+        self.payment_ids[row] = payment_id
+        self.window_mask[row] = 0
+        self.transaction_ids[row] = transaction_id
+        if transaction_id is not None:
+            self._live_transaction_ids.add(transaction_id)
+
+        self.end += 1
+        return self.end - 1
+
+    def extend(self, transaction_ids: List[Optional[str]], amounts: np.ndarray,
+               timestamps: np.ndarray, hours: np.ndarray, weekdays: np.ndarray,
+               location_ids: List[int], merchant_ids: List[int],
+               payment_ids: List[int]) -> int:
+        """Store several events in order and return the sequence number of the first."""
+        count = len(timestamps)
+        self._reserve(count)
+        row = self.end - self.base
+        rows = slice(row, row + count)
+
+        previous = np.empty(count)
+        previous[0] = self.timestamps.item(row - 1) if len(self) else -np.inf
+        previous[1:] = timestamps[:-1]
+        disorder = np.flatnonzero(timestamps < previous)
+        if len(disorder):
+            self.last_disorder = self.end + int(disorder[-1])
+
+        self.amounts[rows] = amounts
+        self.timestamps[rows] = timestamps
+        self.hours[rows] = hours
+        self.weekdays[rows] = weekdays
+        self.location_ids[rows] = location_ids
+        self.merchant_ids[rows] = merchant_ids
+        self.payment_ids[rows] = payment_ids
+        self.window_mask[rows] = 0
+        self.transaction_ids[rows] = transaction_ids
+        self._live_transaction_ids.update(
+            transaction_id for transaction_id in transaction_ids if transaction_id is not None
+        )
+
+        self.end += count
+        return self.end - count
+
+    def popleft(self) -> None:
+        """Drop the oldest live event."""
+        row = self.start - self.base
+        self._live_transaction_ids.discard(self.transaction_ids[row])
+        self.transaction_ids[row] = None
+        self.start += 1
+
+    def live_rows(self) -> slice:
+        """Row slice covering all live events, oldest first."""
+        return slice(self.start - self.base, self.end - self.base)
+
+    def rows_after(self, cutoff_time: float) -> np.ndarray:
+        """Rows of live events with timestamps after the cutoff, oldest first."""
+        live = self.live_rows()
+        timestamps = self.timestamps[live]
+        if self.is_sorted:
+            # Binary search for the first event inside the window
+            first = np.searchsorted(timestamps, cutoff_time, side='right')
+            return np.arange(live.start + first, live.stop)
+        rows: np.ndarray = np.flatnonzero(timestamps > cutoff_time) + live.start
+        return rows
+
+    def _reserve(self, count: int) -> None:
+        """Make room for count more events, compacting and growing the block as needed."""
+        if self.end - self.base + count <= self.offset + self.capacity:
+            return
+
+        live = len(self)
+        capacity = self.capacity
+        while live + count > capacity:
+            capacity *= 2
+        if capacity == self.capacity and live > capacity // 2:
+            # Grow rather than compact a block that is over half full
+            capacity *= 2
+        self._resize(capacity)
+
+    def release(self) -> None:
+        """Hand the buffer's rows back to the arena; the buffer must not be used after."""
+        if self.page is not None:
+            self.arena.release(self.page, self.offset, self.capacity)
+            self.page = None
+
+    def _resize(self, capacity: int) -> None:
+        """Move live rows to the front of a newly allocated block of the given capacity."""
+        page, offset = self.arena.allocate(capacity)
+        rows = self.live_rows()
+        live = len(self)
+        for name, _ in _COLUMNS:
+            column = getattr(page, name)
+            if live:
+                column[offset:offset + live] = getattr(self, name)[rows]
+            setattr(self, name, column)
+
+        self.release()
+        self.page = page
+        self.offset = offset
+        self.capacity = capacity
+        self.base = self.start - offset
+
+
+class SlidingMoments:
+    """Count, mean and M2 of a FIFO window of values, using the two-stacks algorithm.
+
+    Values are pushed at the back and popped from the front. The back stack
+    only keeps a running Welford aggregate of its values; the front stack
+    keeps suffix aggregates, so its top always summarizes every value in it.
+    When the front runs dry the back is flipped onto it, so each value is
+    merged a constant number of times (amortized O(1) per operation), and a
+    query merges the two partials with Chan's parallel formula. Values are
+    never subtracted back out, so evictions leave no rounding residue.
+    """
+
+    __slots__ = ('_front_means', '_front_m2s', '_back', '_back_mean', '_back_m2')
+
+    def __init__(self, values: Iterable[float] = ()):
+        # Suffix aggregates; entry i covers the newest i + 1 front values
+        self._front_means: List[float] = []
+        self._front_m2s: List[float] = []
+        self._back: List[float] = []
+        self._back_mean = 0.0
+        self._back_m2 = 0.0
+        for value in values:
+            self.push(value)
+
+    def __len__(self) -> int:
+        return len(self._front_means) + len(self._back)
+
+    def push(self, value: float) -> None:
+        """Add a value at the back of the window."""
+        self._back.append(value)
+        delta = value - self._back_mean
+        self._back_mean += delta / len(self._back)
+        self._back_m2 += delta * (value - self._back_mean)
+
+    def pop(self) -> None:
+        """Remove the oldest value."""
+        if not self._front_means:
+            self._flip()
+        self._front_means.pop()
+        self._front_m2s.pop()
+
+    def query(self) -> Tuple[int, float, float]:
+        """Return (count, mean, M2) over all values in the window."""
+        front_count = len(self._front_means)
+        back_count = len(self._back)
+        if not front_count:
+            return back_count, self._back_mean, self._back_m2
+
+        front_mean = self._front_means[-1]
+        front_m2 = self._front_m2s[-1]
+        if not back_count:
+            return front_count, front_mean, front_m2
+
+        count = front_count + back_count
+        delta = self._back_mean - front_mean
+        mean = front_mean + delta * back_count / count
+        m2 = front_m2 + self._back_m2 + delta * delta * front_count * back_count / count
+        return count, mean, m2
+
+    def _flip(self) -> None:
+        """Move the back values onto the front stack, oldest ending up on top."""
+        mean = 0.0
+        m2 = 0.0
+        for count, value in enumerate(reversed(self._back), 1):
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+            self._front_means.append(mean)
+            self._front_m2s.append(m2)
+
+        self._back.clear()
+        self._back_mean = 0.0
+        self._back_m2 = 0.0
+
+
+@dataclass(slots=True)
+class WindowAggregate:
+    """Running aggregates over the events inside one sliding time window.
+
+    Events are added as they arrive and evicted from the front once their
+    timestamp falls out of the window, so reads never rescan the history.
+    Membership is recorded in the buffer's ``window_mask`` column, so events
+    that arrived already outside the window are skipped. Eviction is exact
+    by timestamp: in-order events leave from the front, and while the window
+    holds events that arrived out of timestamp order, expired members behind
+    the front are found with a vectorized scan and removed as well.
+
+    Amount statistics and hour/weekday histograms cover the historical events
+    only (all but the newest), which is exactly what the newest event is
+    compared against. Categorical counters are keyed by vocabulary id.
+    """
+    buffer: EventBuffer
+    window_minutes: int
+    bit: int = 1
+    start: int = 0    # Sequence number of the oldest event in the window
+    newest: int = -1  # Sequence number of the newest event in the window
+    count: int = 0
+    amount_stats: SlidingMoments = field(default_factory=SlidingMoments)
+    locations: Counter = field(default_factory=Counter)
+    merchants: Counter = field(default_factory=Counter)
+    payment_methods: Counter = field(default_factory=Counter)
+    hour_counts: List[int] = field(default_factory=lambda: [0] * 24)
+    weekday_counts: List[int] = field(default_factory=lambda: [0] * 7)
+
+    @property
+    def recent_amount(self) -> float:
+        """Amount of the newest event in the window."""
+        amount: float = self.buffer.amounts.item(self.newest - self.buffer.base)
+        return amount
+
+    @property
+    def recent_location_id(self) -> int:
+        """Location id of the newest event in the window."""
+        location_id: int = self.buffer.location_ids.item(self.newest - self.buffer.base)
+        return location_id
+
+    @property
+    def recent_hour(self) -> int:
+        """Hour of day of the newest event in the window."""
+        hour: int = self.buffer.hours.item(self.newest - self.buffer.base)
+        return hour
+
+    @property
+    def recent_weekday(self) -> int:
+        """Day of week of the newest event in the window."""
+        weekday: int = self.buffer.weekdays.item(self.newest - self.buffer.base)
+        return weekday
+
+    def append(self, seq: int) -> None:
+        """Add the buffer's event with this sequence number as the newest in the window."""
+        buffer = self.buffer
+        row = seq - buffer.base
+        buffer.window_mask[row] |= self.bit
+
+        if self.count:
+            # The previous newest event becomes part of the history
+            previous = self.newest - buffer.base
+            self.amount_stats.push(buffer.amounts.item(previous))
+            self.hour_counts[buffer.hours.item(previous)] += 1
+            self.weekday_counts[buffer.weekdays.item(previous)] += 1
+        else:
+            self.start = seq
+
+        self.newest = seq
+        self.count += 1
+        _increment(self.locations, buffer.location_ids.item(row))
+        _increment(self.merchants, buffer.merchant_ids.item(row))
+        _increment(self.payment_methods, buffer.payment_ids.item(row))
+
+    def popleft(self) -> None:
+        """Remove the oldest event from the window."""
+        buffer = self.buffer
+        row = self.start - buffer.base
+        self.count -= 1
+
+        if self.count:
+            # Anything but the newest event is historical
+            self.hour_counts[buffer.hours.item(row)] -= 1
+            self.weekday_counts[buffer.weekdays.item(row)] -= 1
+
+            # Advance to the next event that entered this window
+            seq = self.start + 1
+            while not buffer.window_mask[seq - buffer.base] & self.bit:
+                seq += 1
+            self.start = seq
+
+            self.amount_stats.pop()
+        else:
+            self.start = buffer.end
+            self.newest = -1
+
+        _decrement(self.locations, buffer.location_ids.item(row))
+        _decrement(self.merchants, buffer.merchant_ids.item(row))
+        _decrement(self.payment_methods, buffer.payment_ids.item(row))
+
+    def historical_amount_stats(self) -> Tuple[int, float, float]:
+        """Return (count, mean, M2) of amounts excluding the newest event."""
+        return self.amount_stats.query()
+
+    def member_rows(self) -> np.ndarray:
+        """Buffer rows of the events in the window, oldest first."""
+        if not self.count:
+            return np.empty(0, dtype=np.intp)
+        rows = slice(self.start - self.buffer.base, self.newest - self.buffer.base + 1)
+        return np.flatnonzero(self.buffer.window_mask[rows] & self.bit) + rows.start
+
+    def cutoff(self, current_time: float) -> float:
+        """Timestamp at or before which events fall out of the window."""
+        return current_time - (self.window_minutes * 60)
+
+    def evict(self, cutoff_time: float) -> None:
+        """Evict events with timestamps at or before the cutoff."""
+        buffer = self.buffer
+        timestamps = buffer.timestamps
+        evicted = 0
+        while self.count and timestamps.item(self.start - buffer.base) <= cutoff_time:
+            if evicted == _BULK_EVICT_THRESHOLD:
+                # Long idle gap: rebuilding from what's left beats undoing each event
+                rows = self.member_rows()
+                expired = timestamps[rows] <= cutoff_time
+                keep_from = len(rows) if expired.all() else int(expired.argmin())
+                self.rebuild(rows[keep_from:])
+                break
+            self.popleft()
+            evicted += 1
+
+        if self.count and buffer.last_disorder > self.start:
+            # A late event can sit behind newer ones, so the front alone doesn't
+            # tell whether anything expired; check every member
+            rows = self.member_rows()
+            expired = timestamps[rows] <= cutoff_time
+            if expired.any():
+                buffer.window_mask[rows[expired]] ^= self.bit
+                self.rebuild(rows[~expired])
+
+    def rebuild(self, rows: np.ndarray) -> None:
+        """Recompute all aggregates from scratch for the given member rows, oldest first."""
+        buffer = self.buffer
+        self.count = len(rows)
+        if not self.count:
+            self.start = buffer.end
+            self.newest = -1
+            self.locations = Counter()
+            self.merchants = Counter()
+            self.payment_methods = Counter()
+        else:
+            self.start = int(rows[0]) + buffer.base
+            self.newest = int(rows[-1]) + buffer.base
+            self.locations = _count_ids(buffer.location_ids[rows])
+            self.merchants = _count_ids(buffer.merchant_ids[rows])
+            self.payment_methods = _count_ids(buffer.payment_ids[rows])
+
+        # Histograms and amount statistics cover all but the newest event
+        history = rows[:-1]
+        self.hour_counts = np.bincount(buffer.hours[history], minlength=24).tolist()
+        self.weekday_counts = np.bincount(buffer.weekdays[history], minlength=7).tolist()
+        self.amount_stats = SlidingMoments(buffer.amounts[history].tolist())
+
+
+@dataclass(slots=True)
 class UserState:
     """State container for a single user."""
-    recent_events: deque = field(default_factory=lambda: deque(maxlen=1000))
+    events: EventBuffer = field(default_factory=EventBuffer)
+    windows: Dict[int, WindowAggregate] = field(default_factory=dict)
     feature_vector: Dict[str, Any] = field(default_factory=dict)
+    features_dirty: bool = False  # Events changed since feature_vector was computed
     last_updated: float = field(default_factory=time.time)
     created_at: float = field(default_factory=time.time)
 
@@ -18,34 +593,155 @@ class UserState:
 class StateStore:
     """In-memory state store with TTL and memory management."""
 
-    def __init__(self, max_window_minutes: int = 60, cleanup_interval: int = 300):
+    def __init__(self, max_window_minutes: int = 60, cleanup_interval: int = 300,
+                 window_minutes: Tuple[int, ...] = DEFAULT_WINDOW_MINUTES):
+        if len(window_minutes) > 32:
+            raise ValueError("At most 32 windows can be tracked per user")
+
         self.max_window_minutes = max_window_minutes
         self.cleanup_interval = cleanup_interval
+        self.window_minutes = tuple(window_minutes)
         self.last_cleanup = time.time()
+        self.vocabulary = Vocabulary()
+        self.arena = EventArena()
         self._store: Dict[str, UserState] = {}
+        # (last_updated, user_id) pushed on every update; entries whose time no
+        # longer matches the user's last_updated are superseded and skipped
+        self._expiry_heap: List[Tuple[float, str]] = []
 
     def get_user_state(self, user_id: str) -> UserState:
         """Get or create user state."""
         if user_id not in self._store:
-            self._store[user_id] = UserState()
+            buffer = EventBuffer(arena=self.arena)
+            self._store[user_id] = UserState(
+                events=buffer,
+                windows={
+                    minutes: WindowAggregate(buffer, minutes, bit=1 << i)
+                    for i, minutes in enumerate(self.window_minutes)
+                }
+            )
+            self._push_expiry(user_id, self._store[user_id].last_updated)
         return self._store[user_id]
 
     def update_user_events(self, user_id: str, event: Dict[str, Any]) -> None:
         """Add event to user's recent events."""
         state = self.get_user_state(user_id)
-        state.recent_events.append(event)
-        state.last_updated = time.time()
+        buffer = state.events
+        if len(buffer) == buffer.max_events:
+            self._drop_oldest_event(state)
+
+        timestamp = event.get('timestamp_unix', 0)
+        # Derive time-of-day fields once here instead of on every feature read
+        hour, weekday = get_hour_and_weekday(timestamp)
+        encode = self.vocabulary.encode
+        seq = buffer.append(
+            event.get('transaction_id'),
+            event.get('amount', 0),
+            timestamp,
+            hour,
+            weekday,
+            encode(event.get('location')),
+            encode(event.get('merchant')),
+            encode(event.get('payment_method'))
+        )
+
+        current_time = time.time()
+        for window in state.windows.values():
+            cutoff_time = window.cutoff(current_time)
+            window.evict(cutoff_time)
+            if timestamp > cutoff_time:
+                window.append(seq)
+
+        state.features_dirty = True
+        state.last_updated = current_time
+        self._push_expiry(user_id, current_time)
+
+    def update_user_events_batch(self, user_id: str, events: List[Dict[str, Any]]) -> None:
+        """Add several events, in order, to a user's recent events.
+
+        Large batches are written to the buffer column-wise and each window is
+        rebuilt once, instead of updating every aggregate per event.
+        """
+        if len(events) < _BULK_APPEND_THRESHOLD:
+            for event in events:
+                self.update_user_events(user_id, event)
+            return
+
+        state = self.get_user_state(user_id)
+        buffer = state.events
+        # Only the newest max_events can survive; windows are rebuilt below
+        events = events[-buffer.max_events:]
+        while len(buffer) + len(events) > buffer.max_events:
+            buffer.popleft()
+
+        timestamps = np.array([event.get('timestamp_unix', 0) for event in events], dtype=np.float64)
+        # Vectorized get_hour_and_weekday
+        days, seconds = np.divmod(timestamps, 86400)
+        encode = self.vocabulary.encode
+        first_seq = buffer.extend(
+            [event.get('transaction_id') for event in events],
+            np.array([event.get('amount', 0) for event in events], dtype=np.float64),
+            timestamps,
+            seconds // 3600,
+            (days + 3) % 7,
+            [encode(event.get('location')) for event in events],
+            [encode(event.get('merchant')) for event in events],
+            [encode(event.get('payment_method')) for event in events]
+        )
+
+        current_time = time.time()
+        first_row = first_seq - buffer.base
+        for window in state.windows.values():
+            cutoff_time = window.cutoff(current_time)
+            buffer.window_mask[first_row + np.flatnonzero(timestamps > cutoff_time)] |= window.bit
+
+            # Existing members still in the buffer plus the new ones, minus the expired front
+            start = max(window.start, buffer.start) if window.count else first_seq
+            span = slice(start - buffer.base, buffer.end - buffer.base)
+            rows = np.flatnonzero(buffer.window_mask[span] & window.bit) + span.start
+            expired = buffer.timestamps[rows] <= cutoff_time
+            keep_from = len(rows) if expired.all() else int(expired.argmin())
+            window.rebuild(rows[keep_from:])
+
+        state.features_dirty = True
+        state.last_updated = current_time
+        self._push_expiry(user_id, current_time)
 
     def update_user_features(self, user_id: str, features: Dict[str, Any]) -> None:
         """Update user's feature vector."""
         state = self.get_user_state(user_id)
-        state.feature_vector.update(features)
+        # Replace rather than mutate so vectors already handed out never change
+        state.feature_vector = {**state.feature_vector, **features}
+        state.features_dirty = False
         state.last_updated = time.time()
+        self._push_expiry(user_id, state.last_updated)
 
     def get_user_features(self, user_id: str) -> Dict[str, Any]:
-        """Get user's current feature vector."""
-        state = self.get_user_state(user_id)
-        return state.feature_vector.copy()
+        """Get user's current feature vector.
+
+        The returned dict is shared with the store and must not be modified.
+        """
+        state = self._store.get(user_id)
+        return state.feature_vector if state is not None else {}
+
+    def has_transaction(self, user_id: str, transaction_id: str) -> bool:
+        """Check whether a transaction is already in the user's recent events."""
+        state = self._store.get(user_id)
+        return state is not None and transaction_id in state.events
+
+    def features_outdated(self, user_id: str) -> bool:
+        """Check whether events arrived since the user's features were last computed."""
+        state = self._store.get(user_id)
+        return state is not None and state.features_dirty
+
+    def get_window(self, user_id: str, window_minutes: int) -> Optional[WindowAggregate]:
+        """Get the up-to-date aggregate for one of the user's tracked windows."""
+        if user_id not in self._store:
+            return None
+
+        window = self._store[user_id].windows[window_minutes]
+        window.evict(window.cutoff(time.time()))
+        return window
 
     def get_recent_events(self, user_id: str, window_minutes: Optional[int] = None) -> List[Dict[str, Any]]:
         """Get user's recent events within time window."""
@@ -54,43 +750,55 @@ class StateStore:
 
         state = self._store[user_id]
         window_minutes = window_minutes or self.max_window_minutes
-        cutoff_time = time.time() - (window_minutes * 60)
 
-        # Filter events within time window
-        recent_events = []
-        for event in state.recent_events:
-            if event.get('timestamp_unix', 0) > cutoff_time:
-                recent_events.append(event)
+        if window_minutes in state.windows:
+            # Tracked windows already know exactly which events are in range
+            window = state.windows[window_minutes]
+            window.evict(window.cutoff(time.time()))
+            rows = window.member_rows()
+        else:
+            rows = state.events.rows_after(time.time() - (window_minutes * 60))
 
-        return recent_events
+        return self._build_events(user_id, state.events, rows)
 
     def clear_old_entries(self) -> int:
         """Clear entries older than max_window_minutes. Returns count of cleared entries."""
         current_time = time.time()
         cutoff_time = current_time - (self.max_window_minutes * 60)
 
-        users_to_remove = []
-        for user_id, state in self._store.items():
-            # Remove if no recent activity and old creation time
-            if (state.last_updated < cutoff_time and
-                state.created_at < cutoff_time and
-                not state.recent_events):
-                users_to_remove.append(user_id)
+        # Only users idle since before the cutoff are visited
+        heap = self._expiry_heap
+        users_to_keep = []
+        removed = 0
+        while heap and heap[0][0] < cutoff_time:
+            last_updated, user_id = heapq.heappop(heap)
+            state = self._store.get(user_id)
+            if state is None or state.last_updated != last_updated:
+                continue  # Superseded by a later update
+
+            # Clean old events from the buffer
+            buffer = state.events
+            while len(buffer) and buffer.timestamps.item(buffer.start - buffer.base) < cutoff_time:
+                self._drop_oldest_event(state)
+
+            # Remove if no recent events and old creation time
+            if state.created_at < cutoff_time and not len(buffer):
+                buffer.release()
+                del self._store[user_id]
+                removed += 1
             else:
-                # Clean old events from deque
-                while state.recent_events and state.recent_events[0].get('timestamp_unix', 0) < cutoff_time:
-                    state.recent_events.popleft()
+                users_to_keep.append((last_updated, user_id))
 
-        # Remove old users
-        for user_id in users_to_remove:
-            del self._store[user_id]
+        # Recheck kept users at the next cleanup
+        for entry in users_to_keep:
+            heapq.heappush(heap, entry)
 
         self.last_cleanup = current_time
-        return len(users_to_remove)
+        return removed
 
     def get_stats(self) -> Dict[str, Any]:
         """Get store statistics."""
-        total_events = sum(len(state.recent_events) for state in self._store.values())
+        total_events = sum(len(state.events) for state in self._store.values())
         return {
             'total_users': len(self._store),
             'total_events': total_events,
@@ -101,3 +809,43 @@ class StateStore:
     def should_cleanup(self) -> bool:
         """Check if cleanup is due."""
         return time.time() - self.last_cleanup > self.cleanup_interval
+
+    def _push_expiry(self, user_id: str, last_updated: float) -> None:
+        """Record a user's new last_updated time in the expiry heap."""
+        heap = self._expiry_heap
+        heapq.heappush(heap, (last_updated, user_id))
+
+        if len(heap) > _EXPIRY_HEAP_SLACK * (len(self._store) + 1):
+            # Drop superseded entries so the heap stays proportional to the user count
+            heap[:] = [(state.last_updated, uid) for uid, state in self._store.items()]
+            heapq.heapify(heap)
+
+    @staticmethod
+    def _drop_oldest_event(state: UserState) -> None:
+        """Drop the user's oldest event from history and from any window holding it."""
+        seq = state.events.start
+        for window in state.windows.values():
+            # Windows only ever start at or after the oldest event
+            if window.count and window.start == seq:
+                window.popleft()
+        state.events.popleft()
+
+    def _build_events(self, user_id: str, buffer: EventBuffer, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """Materialize event dicts for the given buffer rows."""
+        decode = self.vocabulary.decode
+        events = []
+        for row in rows.tolist():
+            timestamp = buffer.timestamps.item(row)
+            event = {
+                'user_id': user_id,
+                'transaction_id': buffer.transaction_ids[row],
+                'amount': buffer.amounts.item(row),
+                'timestamp': to_iso_timestamp(timestamp),
+                'timestamp_unix': timestamp
+            }
+            for field_name, column in _CATEGORICAL_FIELDS:
+                value = decode(getattr(buffer, column).item(row))
+                if value:
+                    event[field_name] = value
+            events.append(event)
+        return events
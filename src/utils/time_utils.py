@@ -1,20 +1,32 @@
 """Time utilities for real-time feature engineering."""
 
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional, Tuple
 
 
+@lru_cache(maxsize=4096)
+def _parse_iso_timestamp(timestamp_str: str) -> float:
+    """Parse ISO timestamp string to unix timestamp, raising if malformed."""
+    # fromisoformat accepts a trailing 'Z' as of Python 3.11
+    return datetime.fromisoformat(timestamp_str).timestamp()
+
+
 def parse_timestamp(timestamp_str: str) -> float:
     """Parse ISO timestamp string to unix timestamp."""
     try:
-        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        return dt.timestamp()
-    except (ValueError, AttributeError):
-        # Fallback to current time if parsing fails
+        return _parse_iso_timestamp(timestamp_str)
+    except (ValueError, TypeError):
+        # Fallback to current time if parsing fails (kept out of the cache)
         return time.time()
 
 
+def to_iso_timestamp(timestamp: float) -> str:
+    """Format a unix timestamp as a UTC ISO timestamp string."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
 def get_current_unix_timestamp() -> float:
     """Get current unix timestamp."""
     return time.time()
@@ -41,6 +53,13 @@ def get_time_features(timestamp: float) -> dict:
     }
 
 
+def get_hour_and_weekday(timestamp: float) -> Tuple[int, int]:
+    """Get UTC (hour_of_day, day_of_week) using integer arithmetic only."""
+    days, seconds = divmod(timestamp, 86400)
+    # 1970-01-01 was a Thursday (day_of_week 3, 0=Monday)
+    return int(seconds // 3600), int((days + 3) % 7)
+
+
 def calculate_time_diff_minutes(timestamp1: float, timestamp2: float) -> float:
     """Calculate difference between two timestamps in minutes."""
     return abs(timestamp1 - timestamp2) / 60
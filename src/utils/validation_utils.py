@@ -12,6 +12,9 @@ OPTIONAL_EVENT_FIELDS = [
     'merchant', 'location', 'payment_method'
 ]
 
+# Alphanumeric, underscores, hyphens (\Z so a trailing newline doesn't match)
+_USER_ID_RE = re.compile(r'^[a-zA-Z0-9_-]+\Z')
+
 
 def validate_event(event: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
     """Validate event structure and required fields."""
@@ -53,8 +56,10 @@ def validate_user_id(user_id: str) -> bool:
     """Validate user ID format."""
     if not user_id or not isinstance(user_id, str):
         return False
-    # Allow alphanumeric, underscores, hyphens
-    return bool(re.match(r'^[a-zA-Z0-9_-]+$', user_id))
+    # Plain ASCII alphanumeric IDs are the common case and need no regex
+    if user_id.isascii() and user_id.isalnum():
+        return True
+    return _USER_ID_RE.match(user_id) is not None
 
 
 def sanitize_event(event: Dict[str, Any]) -> Dict[str, Any]:
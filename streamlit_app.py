@@ -5,18 +5,19 @@ Streamlit application for demonstrating fraud detection capabilities
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
-from datetime import datetime, timezone
 import json
 import time
+import uuid
 import sys
 import os
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
+from src.scoring import FEATURE_ORDER, feature_matrix, fraud_score, fraud_scores
 from src.streaming_features import RealTimeFeatureEngine
 
 # Page configuration
@@ -27,15 +28,24 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize session state
-if 'engine' not in st.session_state:
-    st.session_state.engine = RealTimeFeatureEngine()
+# Recent transactions table: number of rows shown and their columns
+RECENT_ROWS = 10
+DISPLAY_COLUMNS = ['timestamp', 'user_id', 'amount', 'merchant', 'location', 'fraud_score']
 
-if 'transactions' not in st.session_state:
-    st.session_state.transactions = []
+# Transactions kept per session; older ones are dropped as new ones arrive
+MAX_TRANSACTIONS = 500
+
+# Form choices, built once rather than on every rerun; TxBuffer stores each
+# as its index in these tuples
+MERCHANTS = ("Amazon", "Walmart", "Starbucks", "Target", "Best Buy", "Apple", "Unknown")
+LOCATIONS = ("New York", "Los Angeles", "Chicago", "Houston", "Miami", "Seattle", "Unknown")
+PAYMENTS = ("credit_card", "debit_card", "paypal", "apple_pay")
+MERCHANT_IDX = {name: i for i, name in enumerate(MERCHANTS)}
+LOCATION_IDX = {name: i for i, name in enumerate(LOCATIONS)}
+PAYMENT_IDX = {name: i for i, name in enumerate(PAYMENTS)}
 
-# Custom CSS for better styling
-st.markdown("""
+# Custom CSS for better styling, injected at the top of every run
+CSS = """
 <style>
     .main-header {
         text-align: center;
@@ -66,9 +76,161 @@ st.markdown("""
         margin: 0.5rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+class TxBuffer:
+    """The newest maxlen processed transactions, stored column-wise in NumPy arrays.
+
+    Merchant, location and payment method are kept as uint8 codes, and each
+    transaction's features as a float32 row in FEATURE_ORDER. Live rows are
+    start..n. The arrays double when full up to 2 * maxlen rows; after that,
+    filling up moves the live rows to the front, dropping evicted ones.
+    """
+
+    _ARRAYS = ('timestamps', 'amounts', 'scores', 'merchants', 'locations', 'payments', 'features')
+
+    def __init__(self, capacity=64, maxlen=MAX_TRANSACTIONS):
+        self.maxlen = maxlen
+        self.start = 0  # Rows before start have been evicted
+        self.n = 0
+        self.timestamps = np.empty(capacity, dtype=np.int64)  # Unix nanoseconds
+        self.amounts = np.empty(capacity, dtype=np.float32)
+        self.scores = np.empty(capacity, dtype=np.float32)
+        self.merchants = np.empty(capacity, dtype=np.uint8)
+        self.locations = np.empty(capacity, dtype=np.uint8)
+        self.payments = np.empty(capacity, dtype=np.uint8)
+        self.features = np.empty((capacity, len(FEATURE_ORDER)), dtype=np.float32)
+        self.user_ids = []
+        self.transaction_ids = []
+
+    def __len__(self):
+        return self.n - self.start
+
+    def extend(self, events, scores, features):
+        """Append events with their fraud scores and feature matrix rows."""
+        if len(events) > self.maxlen:
+            events, scores, features = events[-self.maxlen:], scores[-self.maxlen:], features[-self.maxlen:]
+
+        end = self.n + len(events)
+        if end > len(self.amounts):
+            self._make_room(end)
+            end = self.n + len(events)
+
+        rows = slice(self.n, end)
+        self.timestamps[rows] = [event['ts_ns'] for event in events]
+        self.amounts[rows] = [event['amount'] for event in events]
+        self.merchants[rows] = [MERCHANT_IDX[event['merchant']] for event in events]
+        self.locations[rows] = [LOCATION_IDX[event['location']] for event in events]
+        self.payments[rows] = [PAYMENT_IDX[event['payment_method']] for event in events]
+        self.scores[rows] = scores
+        self.features[rows] = features
+        self.user_ids.extend(event['user_id'] for event in events)
+        self.transaction_ids.extend(event['transaction_id'] for event in events)
+        self.n = end
+        self.start = max(self.start, end - self.maxlen)
+
+    def latest(self):
+        """Fraud score and features dict of the newest transaction."""
+        last = self.n - 1
+        return self.scores.item(last), dict(zip(FEATURE_ORDER, self.features[last].tolist()))
+
+    def recent_frame(self, rows):
+        """The newest rows transactions, formatted for display."""
+        tail = slice(max(self.n - rows, self.start), self.n)
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(self.timestamps[tail], unit='ns').strftime('%H:%M:%S'),
+            'user_id': self.user_ids[tail],
+            'amount': [f"${amount:.2f}" for amount in self.amounts[tail].tolist()],
+            'merchant': [MERCHANTS[code] for code in self.merchants[tail].tolist()],
+            'location': [LOCATIONS[code] for code in self.locations[tail].tolist()],
+            'fraud_score': self.scores[tail]
+        }, columns=DISPLAY_COLUMNS)
+
+    def _make_room(self, end):
+        """Make rows up to end fit, dropping rows that writing them would evict."""
+        start = max(self.start, end - self.maxlen)
+        needed = end - start
+        capacity = len(self.amounts)
+        if capacity < 2 * self.maxlen:
+            # Room for maxlen rows of slack keeps the moves amortized O(1) per row
+            capacity = max(min(2 * capacity, 2 * self.maxlen), needed)
+
+        for name in self._ARRAYS:
+            old = getattr(self, name)
+            new = old if capacity == len(old) else np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n - start] = old[start:self.n]
+            setattr(self, name, new)
+        del self.user_ids[:start]
+        del self.transaction_ids[:start]
+        self.n -= start
+        self.start = 0
+
+def new_score_histogram():
+    """Empty fraud score distribution chart; new scores only replace its trace's x."""
+    fig = go.Figure(go.Histogram(x=[], nbinsx=20, marker_color='#1f77b4'))
+    fig.update_layout(
+        title="Distribution of Fraud Scores", xaxis_title="Fraud Score", yaxis_title="Frequency",
+        height=300, uirevision='fraud_hist'  # Keep zoom/pan across updates
+    )
+    return fig
+
+@st.cache_resource
+def get_engine():
+    """Feature engine shared by all sessions (it serializes access internally)."""
+    return RealTimeFeatureEngine()
+
+# Initialize session state
+if 'transactions' not in st.session_state:
+    st.session_state.transactions = TxBuffer()
+
+if 'tx_df' not in st.session_state:
+    # Last RECENT_ROWS transactions, already formatted for display
+    st.session_state.tx_df = pd.DataFrame(columns=DISPLAY_COLUMNS)
+
+if 'hist_fig' not in st.session_state:
+    st.session_state.hist_fig = new_score_histogram()
+
+def color_scores(scores):
+    """Background style for each fraud score cell, whole column at once."""
+    return np.select(
+        [scores > 0.7, scores > 0.4],
+        ['background-color: #ffebee', 'background-color: #fff3e0'],
+        'background-color: #e8f5e8'
+    )
+
+def render_latest_features(score, features):
+    """Score badge HTML, risk level and feature cards HTML for a transaction."""
+
+    # Fraud score display
+    if score > 0.7:
+        score_class = "score-high"
+        risk_level = "🚨 HIGH RISK"
+    elif score > 0.4:
+        score_class = "score-medium"
+        risk_level = "⚠️ MEDIUM RISK"
+    else:
+        score_class = "score-low"
+        risk_level = "✅ LOW RISK"
+
+    feature_info = {
+        "Transaction Velocity (1h)": f"{features.get('transaction_velocity_1h', 0):.1f} transactions",
+        "Amount Z-Score": f"{features.get('amount_zscore', 0):.3f}",
+        "Location Anomaly": "Yes" if features.get('location_anomaly', 0) > 0 else "No",
+        "Time Pattern Score": f"{features.get('time_pattern_score', 0):.3f}",
+        "Merchant Diversity": f"{features.get('merchant_diversity', 0):.3f}",
+        "Payment Consistency": f"{features.get('payment_method_consistency', 0):.3f}"
+    }
+
+    # One markdown element for all cards instead of one per feature
+    cards_html = "\n".join(
+        f'<div class="feature-card"><strong>{feature_name}:</strong> {value}</div>'
+        for feature_name, value in feature_info.items()
+    )
+    return f'<div class="{score_class}">Fraud Score: {score:.3f}</div>', risk_level, cards_html
 
 def main():
+    st.markdown(CSS, unsafe_allow_html=True)
+
     # Header
     st.markdown('<h1 class="main-header">🛡️ Real-Time Fraud Detection System</h1>', unsafe_allow_html=True)
     st.markdown("**Live demonstration of real-time feature engineering for fraud detection**")
@@ -81,9 +243,9 @@ def main():
         with st.form("transaction_form"):
             user_id = st.text_input("User ID", value="demo_user", help="Unique user identifier")
             amount = st.number_input("Amount ($)", min_value=0.01, value=100.00, step=0.01)
-            merchant = st.selectbox("Merchant", ["Amazon", "Walmart", "Starbucks", "Target", "Best Buy", "Apple", "Unknown"])
-            location = st.selectbox("Location", ["New York", "Los Angeles", "Chicago", "Houston", "Miami", "Seattle", "Unknown"])
-            payment_method = st.selectbox("Payment Method", ["credit_card", "debit_card", "paypal", "apple_pay"])
+            merchant = st.selectbox("Merchant", MERCHANTS, key="merchant")
+            location = st.selectbox("Location", LOCATIONS, key="location")
+            payment_method = st.selectbox("Payment Method", PAYMENTS, key="payment_method")
 
             submitted = st.form_submit_button("🚀 Process Transaction")
 
@@ -104,97 +266,46 @@ def main():
         st.divider()
 
         st.subheader("System Status")
-        stats = st.session_state.engine.state_store.get_stats()
+        stats = get_engine().get_stats()
         st.metric("Active Users", stats['total_users'])
         st.metric("Total Events", stats['total_events'])
 
     # Main content
+    transactions = st.session_state.transactions
     col1, col2 = st.columns([2, 1])
 
     with col1:
         st.subheader("📊 Recent Transactions")
 
-        if st.session_state.transactions:
-            df = pd.DataFrame(st.session_state.transactions[-10:])  # Show last 10
-
-            # Format the dataframe for display
-            display_df = df.copy()
-            display_df['timestamp'] = pd.to_datetime(display_df['timestamp']).dt.strftime('%H:%M:%S')
-            display_df['amount'] = display_df['amount'].apply(lambda x: f"${x:.2f}")
-            display_df = display_df[['timestamp', 'user_id', 'amount', 'merchant', 'location', 'fraud_score']]
-
-            # Color code fraud scores
-            def color_score(val):
-                if val > 0.7:
-                    return 'background-color: #ffebee'
-                elif val > 0.4:
-                    return 'background-color: #fff3e0'
-                else:
-                    return 'background-color: #e8f5e8'
-
-            styled_df = display_df.style.apply(
-                lambda x: [color_score(x['fraud_score']) if col == 'fraud_score' else '' for col in x.index],
-                axis=1
-            )
+        if transactions:
+            display_df = st.session_state.tx_df  # Last RECENT_ROWS, pre-formatted
+            score_styles = st.session_state.score_styles  # Computed with the frame
+
+            styled_df = display_df.style.apply(lambda _: score_styles, subset=['fraud_score'])
 
             st.dataframe(styled_df, use_container_width=True)
 
             # Fraud score distribution chart
             st.subheader("📈 Fraud Score Distribution")
-            fig = px.histogram(
-                df, x='fraud_score', nbins=20,
-                title="Distribution of Fraud Scores",
-                labels={'fraud_score': 'Fraud Score', 'count': 'Frequency'},
-                color_discrete_sequence=['#1f77b4']
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(st.session_state.hist_fig, use_container_width=True)
         else:
             st.info("No transactions processed yet. Use the sidebar to add transactions or load sample data.")
 
     with col2:
         st.subheader("🎯 Latest Features")
 
-        if st.session_state.transactions:
-            latest_transaction = st.session_state.transactions[-1]
-            user_id = latest_transaction['user_id']
-            features = st.session_state.engine.get_features(user_id)
-
-            # Fraud score display
-            score = latest_transaction['fraud_score']
-            if score > 0.7:
-                score_class = "score-high"
-                risk_level = "🚨 HIGH RISK"
-            elif score > 0.4:
-                score_class = "score-medium"
-                risk_level = "⚠️ MEDIUM RISK"
-            else:
-                score_class = "score-low"
-                risk_level = "✅ LOW RISK"
-
-            st.markdown(f'<div class="{score_class}">Fraud Score: {score:.3f}</div>', unsafe_allow_html=True)
+        if transactions:
+            # Score and features as of the latest transaction, stored when it was processed
+            score_html, risk_level, cards_html = render_latest_features(*transactions.latest())
+
+            st.markdown(score_html, unsafe_allow_html=True)
             st.markdown(f"**Risk Level:** {risk_level}")
 
             st.divider()
 
             # Feature breakdown
             st.markdown("**Real-Time Features:**")
-
-            feature_info = {
-                "Transaction Velocity (1h)": f"{features.get('transaction_velocity_1h', 0):.1f} transactions",
-                "Amount Z-Score": f"{features.get('amount_zscore', 0):.3f}",
-                "Location Anomaly": "Yes" if features.get('location_anomaly', 0) > 0 else "No",
-                "Time Pattern Score": f"{features.get('time_pattern_score', 0):.3f}",
-                "Merchant Diversity": f"{features.get('merchant_diversity', 0):.3f}",
-                "Payment Consistency": f"{features.get('payment_method_consistency', 0):.3f}"
-            }
-
-            for feature_name, value in feature_info.items():
-                st.markdown(f"""
-                <div class="feature-card">
-                    <strong>{feature_name}:</strong> {value}
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(cards_html, unsafe_allow_html=True)
         else:
             st.info("Process a transaction to see feature analysis")
 
@@ -210,47 +321,42 @@ def main():
 
 def process_transaction(user_id, amount, merchant, location, payment_method):
     """Process a new transaction and update the system state."""
-    # Create transaction event
+    # Create transaction event, timestamped in integer nanoseconds (formatted only for display)
+    ts_ns = time.time_ns()
     event = {
         'user_id': user_id,
-        'transaction_id': f'txn_{int(time.time() * 1000)}',
+        # Random suffix: the engine is shared, so ids must be unique across sessions
+        'transaction_id': f'txn_{ts_ns // 1_000_000}_{uuid.uuid4().hex[:12]}',
         'amount': float(amount),
-        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'ts_ns': ts_ns,
         'merchant': merchant,
         'location': location,
         'payment_method': payment_method
     }
 
-    # Process through engine
-    success = st.session_state.engine.process_event(event)
-
-    if success:
-        # Get updated features and calculate score
-        features = st.session_state.engine.get_features(user_id)
-
-        # Calculate fraud score using same logic as API
-        score = (
-            features.get('transaction_velocity_1h', 0) * 0.2 +
-            features.get('amount_zscore', 0) * 0.25 +
-            features.get('location_anomaly', 0) * 0.3 +
-            features.get('time_pattern_score', 0) * 0.15 +
-            -features.get('merchant_diversity', 0) * 0.05 +
-            -features.get('payment_method_consistency', 0) * 0.05
-        )
+    # Process through engine, reading features in the same locked call so another
+    # session's event for this user can't slip in between
+    features = get_engine().process_sequence([event])[0]
 
-        # Apply sigmoid transformation
-        import math
-        score = 1 / (1 + math.exp(-score))
+    if features is not None:
+        # Calculate fraud score with the same scorer as the API
+        score = fraud_score(features)
 
-        # Store transaction with score
-        transaction_record = event.copy()
-        transaction_record['fraud_score'] = score
-        st.session_state.transactions.append(transaction_record)
+        # Store transaction with its score and features
+        st.session_state.transactions.extend([event], [score], feature_matrix([features]))
+        update_display()
 
         st.success(f"✅ Transaction processed! Fraud Score: {score:.3f}")
     else:
         st.error("❌ Failed to process transaction")
 
+def update_display():
+    """Refresh the recent transactions table and the histogram's scores after new transactions."""
+    st.session_state.tx_df = st.session_state.transactions.recent_frame(RECENT_ROWS)
+    scores = st.session_state.tx_df['fraud_score'].to_numpy()
+    st.session_state.score_styles = color_scores(scores)
+    st.session_state.hist_fig.data[0].x = scores
+
 def load_sample_data():
     """Load sample transaction data for demonstration."""
     sample_events = [
@@ -263,16 +369,35 @@ def load_sample_data():
         {'user_id': 'user_002', 'amount': 1500.0, 'merchant': 'Unknown', 'location': 'Miami', 'payment_method': 'paypal'},  # Very suspicious
     ]
 
-    for event_data in sample_events:
-        process_transaction(**event_data)
-        time.sleep(0.1)  # Small delay for realistic timestamps
+    # Synthetic timestamps 100ms apart stand in for real arrival times
+    start_ns = time.time_ns()
+    batch_tag = uuid.uuid4().hex[:12]  # Keeps ids unique across sessions sharing the engine
+    events = [
+        {
+            **event_data,
+            'transaction_id': f'txn_{start_ns // 1_000_000}_{batch_tag}_{i}',
+            'ts_ns': start_ns + i * 100_000_000
+        }
+        for i, event_data in enumerate(sample_events)
+    ]
+
+    # Process all events, then score them in one vectorized pass
+    features = get_engine().process_events(events)
+    scores = fraud_scores(features)
+
+    st.session_state.transactions.extend(events, scores, features)
+    update_display()
 
     st.success("🎯 Sample data loaded! Check the results.")
 
 def clear_history():
-    """Clear all transaction history and reset the engine."""
-    st.session_state.transactions = []
-    st.session_state.engine = RealTimeFeatureEngine()
+    """Clear this session's transaction history.
+
+    The feature engine is shared by all sessions, so its state is left alone.
+    """
+    st.session_state.transactions = TxBuffer()
+    st.session_state.tx_df = pd.DataFrame(columns=DISPLAY_COLUMNS)
+    st.session_state.hist_fig = new_score_histogram()
     st.success("🗑️ History cleared!")
 
 if __name__ == "__main__":
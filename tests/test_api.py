@@ -0,0 +1,80 @@
+"""Tests for the fraud scoring API."""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from src.api import UserBatcher, app
+from src.streaming_features import RealTimeFeatureEngine
+from src.utils.state_store import StateStore
+
+
+def _event(user_id, i, amount, base_time):
+    return {
+        'user_id': user_id,
+        'transaction_id': f'txn_{i:03d}',
+        'amount': amount,
+        'timestamp': (base_time + timedelta(minutes=i)).isoformat(),
+        'merchant': 'Test Merchant',
+        'location': 'Test City',
+        'payment_method': 'credit_card'
+    }
+
+
+class TestUserBatcher:
+    """Test cases for per-user request batching."""
+
+    def test_concurrent_requests_get_their_own_features(self):
+        """Test that each batched request is scored on the state after its own event."""
+        engine = RealTimeFeatureEngine(StateStore(max_window_minutes=60))
+        batch_sizes = []
+        process_sequence = engine.process_sequence
+
+        def spy(events):
+            batch_sizes.append(len(events))
+            return process_sequence(events)
+
+        engine.process_sequence = spy
+        batcher = UserBatcher(engine)
+        base_time = datetime.now(timezone.utc)
+        amounts = [100.0] * 5 + [5000.0]
+
+        async def submit_all():
+            return await asyncio.gather(*(
+                batcher.submit(_event('batch_user', i, amount, base_time))
+                for i, amount in enumerate(amounts)
+            ))
+
+        results = asyncio.run(submit_all())
+
+        assert batch_sizes == [6]  # Coalesced into one engine call
+        assert [features['transaction_velocity_1h'] for features in results] == [1, 2, 3, 4, 5, 6]
+        assert all(features['amount_zscore'] == 0.0 for features in results[:5])
+        assert results[5]['amount_zscore'] > 2.0
+
+    def test_concurrent_fraud_score_requests(self):
+        """Test that concurrent same-user requests to /fraud_score are scored individually."""
+        base_time = datetime.now(timezone.utc)
+        amounts = [100.0] * 5 + [5000.0]
+
+        async def post_all():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await asyncio.gather(*(
+                    client.post('/fraud_score', json=_event('api_batch_user', i, amount, base_time))
+                    for i, amount in enumerate(amounts)
+                ))
+
+        responses = asyncio.run(post_all())
+        assert all(response.status_code == 200 for response in responses)
+
+        bodies = [response.json() for response in responses]
+        velocities = [body['features']['transaction_velocity_1h'] for body in bodies]
+        assert sorted(velocities) == [1, 2, 3, 4, 5, 6]
+
+        outlier = bodies[5]
+        assert outlier['features']['amount_zscore'] > 2.0
+        for body in bodies[:5]:
+            # Benign transactions are never scored on the outlier's state
+            assert body['features']['amount_zscore'] < 1.0
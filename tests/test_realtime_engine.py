@@ -1,25 +1,38 @@
 """Tests for real-time fraud detection engine."""
 
+import math
+import operator
 import pytest
+import random
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
+from src.scoring import FEATURE_ORDER, feature_matrix, fraud_score, fraud_scores
 from src.streaming_features import RealTimeFeatureEngine
-from src.utils.state_store import StateStore
-from src.utils.validation_utils import validate_event
+from src.utils.state_store import (
+    StateStore, EventArena, EventBuffer, SlidingMoments, WindowAggregate
+)
+from src.utils.time_utils import parse_timestamp
+from src.utils.validation_utils import validate_event, validate_user_id
+
+
+@pytest.fixture
+def state_store():
+    """Fresh state store for each test."""
+    return StateStore(max_window_minutes=60)
+
+
+@pytest.fixture
+def engine(state_store):
+    """Feature engine backed by the test's state store."""
+    return RealTimeFeatureEngine(state_store)
 
 
 class TestRealTimeFeatureEngine:
     """Test cases for the real-time feature engine."""
 
-    def setup_method(self):
-        """Setup test fixtures."""
-        self.state_store = StateStore(max_window_minutes=60)
-        self.engine = RealTimeFeatureEngine(self.state_store)
-
-    def test_process_event_updates_state(self):
+    def test_process_event_updates_state(self, engine, state_store):
         """Test that processing an event updates user state."""
-        from datetime import timezone
         event = {
             'user_id': 'test_user',
             'transaction_id': 'txn_001',
@@ -31,21 +44,21 @@ class TestRealTimeFeatureEngine:
         }
 
         # Process event
-        result = self.engine.process_event(event)
+        result = engine.process_event(event)
         assert result is True
 
         # Check that event was stored
-        recent_events = self.state_store.get_recent_events('test_user')
+        recent_events = state_store.get_recent_events('test_user')
         assert len(recent_events) == 1
         assert recent_events[0]['transaction_id'] == 'txn_001'
 
         # Check that features were calculated
-        features = self.engine.get_features('test_user')
+        features = engine.get_features('test_user')
         assert 'transaction_velocity_1h' in features
         assert 'amount_zscore' in features
         assert 'location_anomaly' in features
 
-    def test_feature_vector_shape(self):
+    def test_feature_vector_shape(self, engine):
         """Test that feature vectors have consistent structure."""
         user_id = 'test_user'
 
@@ -61,9 +74,9 @@ class TestRealTimeFeatureEngine:
                 'location': 'Same City' if i < 4 else 'Different City',  # One location change
                 'payment_method': 'credit_card'
             }
-            self.engine.process_event(event)
+            engine.process_event(event)
 
-        features = self.engine.get_features(user_id)
+        features = engine.get_features(user_id)
 
         # Check required features are present
         required_features = [
@@ -87,100 +100,51 @@ class TestRealTimeFeatureEngine:
         assert 0 <= features['location_consistency'] <= 1  # Ratio
         assert 0 <= features['merchant_diversity'] <= 1  # Ratio
 
-    def test_velocity_calculation(self):
-        """Test transaction velocity calculation."""
-        from datetime import timezone
-        user_id = 'velocity_test'
+    @pytest.mark.parametrize('n_events,spacing,last_event,expected', [
+        # 3 transactions in 1 hour
+        (3, timedelta(minutes=10), None,
+         [('transaction_velocity_1h', operator.eq, 3)]),
+        # Consistent amounts, then a much higher one: a significant outlier
+        (10, timedelta(hours=1), (timedelta(hours=11), {'amount': 500.0}),
+         [('amount_zscore', operator.gt, 2.0)]),
+        # Same location, then a different one: anomaly and reduced consistency
+        (9, timedelta(hours=1), (timedelta(hours=10), {'location': 'Foreign City'}),
+         [('location_anomaly', operator.eq, 1), ('location_consistency', operator.lt, 1.0)]),
+    ], ids=['velocity', 'amount_zscore', 'location_anomaly'])
+    def test_feature_after_baseline_events(self, engine, n_events, spacing, last_event, expected):
+        """Test features after a run of identical events and an optional final outlier."""
+        user_id = 'feature_test'
         base_time = datetime.now(timezone.utc)
-
-        # Add events within 1 hour
-        for i in range(3):
-            event = {
-                'user_id': user_id,
-                'transaction_id': f'txn_{i:03d}',
-                'amount': 100.0,
-                'timestamp': (base_time + timedelta(minutes=i*10)).isoformat(),
-                'merchant': 'Test Merchant',
-                'location': 'Test City',
-                'payment_method': 'credit_card'
-            }
-            self.engine.process_event(event)
-
-        features = self.engine.get_features(user_id)
-        assert features['transaction_velocity_1h'] == 3  # 3 transactions in 1 hour
-
-    def test_amount_zscore_calculation(self):
-        """Test amount z-score calculation."""
-        from datetime import timezone
-        user_id = 'amount_test'
-        base_time = datetime.now(timezone.utc)
-
-        # Add baseline transactions
-        for i in range(10):
-            event = {
-                'user_id': user_id,
-                'transaction_id': f'txn_base_{i:03d}',
-                'amount': 100.0,  # Consistent amount
-                'timestamp': (base_time + timedelta(hours=i)).isoformat(),
-                'merchant': 'Test Merchant',
-                'location': 'Test City',
-                'payment_method': 'credit_card'
-            }
-            self.engine.process_event(event)
-
-        # Add outlier transaction
-        outlier_event = {
+        event = {
             'user_id': user_id,
-            'transaction_id': 'txn_outlier',
-            'amount': 500.0,  # Much higher amount
-            'timestamp': (base_time + timedelta(hours=11)).isoformat(),
+            'amount': 100.0,
             'merchant': 'Test Merchant',
             'location': 'Test City',
             'payment_method': 'credit_card'
         }
-        self.engine.process_event(outlier_event)
 
-        features = self.engine.get_features(user_id)
-        assert features['amount_zscore'] > 2.0  # Should be a significant outlier
-
-    def test_location_anomaly_detection(self):
-        """Test location anomaly detection."""
-        from datetime import timezone
-        user_id = 'location_test'
-        base_time = datetime.now(timezone.utc)
-
-        # Add transactions from same location
-        for i in range(9):
-            event = {
-                'user_id': user_id,
+        for i in range(n_events):
+            engine.process_event({
+                **event,
                 'transaction_id': f'txn_{i:03d}',
-                'amount': 100.0,
-                'timestamp': (base_time + timedelta(hours=i)).isoformat(),
-                'merchant': 'Test Merchant',
-                'location': 'Home City',
-                'payment_method': 'credit_card'
-            }
-            self.engine.process_event(event)
-
-        # Add transaction from different location
-        anomaly_event = {
-            'user_id': user_id,
-            'transaction_id': 'txn_anomaly',
-            'amount': 100.0,
-            'timestamp': (base_time + timedelta(hours=10)).isoformat(),
-            'merchant': 'Test Merchant',
-            'location': 'Foreign City',
-            'payment_method': 'credit_card'
-        }
-        self.engine.process_event(anomaly_event)
-
-        features = self.engine.get_features(user_id)
-        assert features['location_anomaly'] == 1  # Should detect anomaly
-        assert features['location_consistency'] < 1.0  # Should show reduced consistency
-
-    def test_time_pattern_scoring(self):
+                'timestamp': (base_time + spacing * i).isoformat()
+            })
+
+        if last_event is not None:
+            offset, overrides = last_event
+            engine.process_event({
+                **event,
+                **overrides,
+                'transaction_id': 'txn_last',
+                'timestamp': (base_time + offset).isoformat()
+            })
+
+        features = engine.get_features(user_id)
+        for name, compare, value in expected:
+            assert compare(features[name], value), (name, features[name])
+
+    def test_time_pattern_scoring(self, engine):
         """Test time pattern anomaly detection."""
-        from datetime import timezone
         user_id = 'time_test'
         base_time = datetime.now(timezone.utc) - timedelta(days=7)  # 1 week ago
 
@@ -196,7 +160,7 @@ class TestRealTimeFeatureEngine:
                 'location': 'Test City',
                 'payment_method': 'credit_card'
             }
-            self.engine.process_event(event)
+            engine.process_event(event)
 
         # Add transaction at unusual time (3 AM)
         unusual_time = base_time + timedelta(days=6, hours=15)  # 3 AM, 6 days later
@@ -209,14 +173,13 @@ class TestRealTimeFeatureEngine:
             'location': 'Test City',
             'payment_method': 'credit_card'
         }
-        self.engine.process_event(unusual_event)
+        engine.process_event(unusual_event)
 
-        features = self.engine.get_features(user_id)
+        features = engine.get_features(user_id)
         assert features['time_pattern_score'] > 0  # Should detect unusual timing
 
-    def test_state_cleanup(self):
+    def test_state_cleanup(self, engine, state_store):
         """Test that old state entries are cleaned up."""
-        from datetime import timezone
         user_id = 'cleanup_test'
 
         # Add event
@@ -229,16 +192,16 @@ class TestRealTimeFeatureEngine:
             'location': 'Test City',
             'payment_method': 'credit_card'
         }
-        self.engine.process_event(event)
+        engine.process_event(event)
 
         # Manually set old timestamps to simulate aging
-        state = self.state_store.get_user_state(user_id)
+        state = state_store.get_user_state(user_id)
         old_time = time.time() - (70 * 60)  # 70 minutes ago
         state.last_updated = old_time
         state.created_at = old_time
 
         # Force cleanup
-        cleared = self.state_store.clear_old_entries()
+        cleared = state_store.clear_old_entries()
         assert cleared >= 0  # May or may not clear depending on timing
 
     def test_invalid_event_handling(self):
@@ -255,12 +218,429 @@ class TestRealTimeFeatureEngine:
         assert not is_valid
         assert 'user_id' in error
 
-    def test_empty_user_features(self):
+    def test_empty_user_features(self, engine):
         """Test getting features for user with no events."""
-        features = self.engine.get_features('nonexistent_user')
+        features = engine.get_features('nonexistent_user')
 
         # Should return default features
         assert features['transaction_velocity_1h'] == 0.0
         assert features['amount_zscore'] == 0.0
         assert features['location_anomaly'] == 0
         assert features['time_pattern_score'] == 0.0
+
+    def test_window_aggregates_track_sliding_windows(self, engine, state_store):
+        """Test that window aggregates only hold events inside each window."""
+        user_id = 'window_test'
+        now = datetime.now(timezone.utc)
+
+        for i, minutes_ago in enumerate([120, 90, 30, 10]):
+            event = {
+                'user_id': user_id,
+                'transaction_id': f'txn_{i:03d}',
+                'amount': 10.0 * (i + 1),
+                'timestamp': (now - timedelta(minutes=minutes_ago)).isoformat(),
+                'merchant': 'Test Merchant',
+                'location': 'Old City' if minutes_ago > 60 else 'New City',
+                'payment_method': 'credit_card'
+            }
+            engine.process_event(event)
+
+        decode = state_store.vocabulary.decode
+
+        window_1h = state_store.get_window(user_id, 60)
+        assert window_1h.count == 2
+        assert window_1h.historical_amount_stats()[:2] == (1, 30.0)  # History excludes the newest event
+        assert {decode(k): v for k, v in window_1h.locations.items()} == {'New City': 2}
+
+        window_24h = state_store.get_window(user_id, 1440)
+        assert window_24h.count == 4
+        assert window_24h.historical_amount_stats()[:2] == (3, 20.0)
+        assert {decode(k): v for k, v in window_24h.locations.items()} == {'Old City': 2, 'New City': 2}
+
+        features = engine.get_features(user_id)
+        assert features['transaction_velocity_1h'] == 2
+
+    def test_amount_stats_exact_after_evicting_large_amounts(self):
+        """Test that evicting large amounts leaves no variance residue behind."""
+        buffer = EventBuffer()
+        window = WindowAggregate(buffer, window_minutes=60)
+        for i in range(50):
+            window.append(buffer.append(f'txn_{i:03d}', 1000.0 + i * 97.3, 1.0, 0, 3, 0, 0, 0))
+        for i in range(20):
+            window.append(buffer.append(f'txn_small_{i:03d}', 19.99, 2.0, 0, 3, 0, 0, 0))
+
+        window.evict(1.5)
+
+        count, mean, m2 = window.historical_amount_stats()
+        assert count == 19
+        assert mean == pytest.approx(19.99)
+        assert m2 == 0.0  # Constant history must fall back to the default std dev
+
+    def test_late_event_evicted_by_its_timestamp(self, engine, state_store, monkeypatch):
+        """Test that an event arriving out of order leaves the window when its timestamp expires."""
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now)
+
+        user_id = 'late_test'
+        # Three in-order events, then one that arrives 55 minutes late
+        for i, minutes_ago in enumerate([30, 20, 10, 55]):
+            engine.process_event({
+                'user_id': user_id,
+                'transaction_id': f'txn_{i:03d}',
+                'amount': 100.0,
+                'timestamp': datetime.fromtimestamp(now - minutes_ago * 60, timezone.utc).isoformat(),
+                'merchant': 'Test Merchant',
+                'location': 'Test City',
+                'payment_method': 'credit_card'
+            })
+        assert engine.get_features(user_id)['transaction_velocity_1h'] == 4
+
+        # Ten minutes on, the late event is 65 minutes old but the front is not
+        now += 10 * 60
+        window = state_store.get_window(user_id, 60)
+        assert window.count == 3
+        assert [event['transaction_id'] for event in state_store.get_recent_events(user_id)] == [
+            'txn_000', 'txn_001', 'txn_002'
+        ]
+
+        engine.process_event({
+            'user_id': user_id,
+            'transaction_id': 'txn_new',
+            'amount': 100.0,
+            'timestamp': datetime.fromtimestamp(now, timezone.utc).isoformat()
+        })
+        assert engine.get_features(user_id)['transaction_velocity_1h'] == 4  # Not 5
+
+    def test_recent_events_for_untracked_window(self, state_store):
+        """Test time filtering for windows without a maintained aggregate."""
+        now = time.time()
+        user_id = 'untracked_window_test'
+
+        # Out-of-order arrival must still be filtered correctly
+        for i, minutes_ago in enumerate([50, 40, 20, 45, 5]):
+            state_store.update_user_events(user_id, {
+                'user_id': user_id,
+                'transaction_id': f'txn_{i:03d}',
+                'amount': 100.0,
+                'timestamp_unix': now - minutes_ago * 60
+            })
+            if i == 2:
+                assert state_store.get_user_state(user_id).events.is_sorted
+                recent = state_store.get_recent_events(user_id, 30)
+                assert [e['transaction_id'] for e in recent] == ['txn_002']
+
+        assert not state_store.get_user_state(user_id).events.is_sorted
+        recent = state_store.get_recent_events(user_id, 42)
+        assert [e['transaction_id'] for e in recent] == ['txn_001', 'txn_002', 'txn_004']
+
+    def test_duplicate_transactions_are_ignored(self, engine, state_store):
+        """Test that replaying a transaction does not change features."""
+        event = {
+            'user_id': 'dedupe_test',
+            'transaction_id': 'txn_001',
+            'amount': 100.0,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'merchant': 'Test Merchant',
+            'location': 'Test City',
+            'payment_method': 'credit_card'
+        }
+
+        assert engine.process_event(event) is True
+        assert engine.process_event(event) is True  # Retry is acknowledged
+
+        assert len(state_store.get_recent_events('dedupe_test')) == 1
+        assert engine.get_features('dedupe_test')['transaction_velocity_1h'] == 1
+
+    def test_features_recomputed_after_direct_store_update(self, engine, state_store):
+        """Test that features are refreshed when events bypass process_event."""
+        user_id = 'dirty_test'
+        state_store.update_user_events(user_id, {
+            'user_id': user_id,
+            'transaction_id': 'txn_001',
+            'amount': 100.0,
+            'timestamp_unix': time.time()
+        })
+
+        assert state_store.features_outdated(user_id)
+        assert engine.get_features(user_id)['transaction_velocity_1h'] == 1
+        assert not state_store.features_outdated(user_id)
+
+    def test_process_batch_matches_sequential_processing(self, engine, state_store):
+        """Test that batched events give the same features as one-by-one processing."""
+        base_time = datetime.now(timezone.utc)
+        events = []
+        for i in range(6):
+            for user_id in ('batch_a', 'batch_b'):
+                events.append({
+                    'user_id': user_id,
+                    'transaction_id': f'{user_id}_txn_{i:03d}',
+                    'amount': 50.0 + i * 10 + (500.0 if i == 5 else 0.0),
+                    'timestamp': (base_time - timedelta(minutes=30 - i)).isoformat(),
+                    'merchant': f'Merchant {i % 3}',
+                    'location': 'Test City',
+                    'payment_method': 'credit_card'
+                })
+        events.append(events[0])  # Duplicate within the batch
+
+        sequential = RealTimeFeatureEngine(StateStore())
+        for event in events:
+            sequential.process_event(event)
+
+        assert engine.process_batch(events) is True
+        for user_id in ('batch_a', 'batch_b'):
+            assert engine.get_features(user_id) == sequential.get_features(user_id)
+            assert len(state_store.get_recent_events(user_id)) == 6
+
+    def test_parse_timestamp_formats_and_fallback(self):
+        """Test ISO parsing with 'Z' suffix and that bad input falls back to now."""
+        assert parse_timestamp('2024-01-01T12:00:00Z') == 1704110400.0
+        assert parse_timestamp('2024-01-01T14:00:00.5+02:00') == 1704110400.5
+
+        before = time.time()
+        first = parse_timestamp('not-a-timestamp')
+        time.sleep(0.01)
+        second = parse_timestamp('not-a-timestamp')
+        assert before <= first < second  # Fallback is not cached
+
+    def test_nanosecond_timestamps_match_iso_timestamps(self, engine, state_store):
+        """Test that events timestamped with integer ts_ns match ISO-timestamped events."""
+        iso_engine = RealTimeFeatureEngine(StateStore(max_window_minutes=60))
+        base_ns = time.time_ns()
+        for i in range(5):
+            ts_ns = base_ns + i * 60_000_000_000
+            event = {
+                'user_id': 'ns_test',
+                'transaction_id': f'txn_{i:03d}',
+                'amount': 40.0 + i * 15,
+                'merchant': f'Merchant_{i % 2}',
+                'location': 'Test City',
+                'payment_method': 'credit_card'
+            }
+            engine.process_event({**event, 'ts_ns': ts_ns})
+            iso_engine.process_event({
+                **event, 'timestamp': datetime.fromtimestamp(ts_ns / 1e9, timezone.utc).isoformat()
+            })
+
+        events = state_store.get_recent_events('ns_test')
+        assert events[-1]['timestamp_unix'] == pytest.approx((base_ns + 4 * 60_000_000_000) / 1e9)
+        assert engine.get_features('ns_test') == pytest.approx(iso_engine.get_features('ns_test'))
+
+    def test_events_without_optional_fields(self, engine):
+        """Test that events missing location and payment method don't look anomalous."""
+        base_time = datetime.now(timezone.utc)
+        for i in range(8):
+            engine.process_event({
+                'user_id': 'sparse_test',
+                'transaction_id': f'txn_{i:03d}',
+                'amount': 100.0,
+                'timestamp': (base_time + timedelta(minutes=i)).isoformat(),
+                'merchant': 'Test Merchant'
+            })
+
+        features = engine.get_features('sparse_test')
+        assert features['location_anomaly'] == 0
+        assert features['location_consistency'] == 1.0
+        assert features['payment_method_consistency'] == 1.0
+
+    def test_validate_user_id(self):
+        """Test user ID format validation."""
+        assert validate_user_id('user123')
+        assert validate_user_id('user_123-abc')
+        assert not validate_user_id('')
+        assert not validate_user_id('user 123')
+        assert not validate_user_id('user123\n')
+        assert not validate_user_id('usér123')
+
+    def test_returned_features_are_not_changed_by_later_events(self, engine, state_store):
+        """Test that feature vectors handed out stay stable as new events arrive."""
+        user_id = 'snapshot_test'
+        assert engine.get_features(user_id)['transaction_velocity_1h'] == 0
+        assert state_store.get_stats()['total_users'] == 0  # Reads don't create state
+
+        event = {
+            'user_id': user_id,
+            'transaction_id': 'txn_001',
+            'amount': 100.0,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        engine.process_event(event)
+        first = engine.get_features(user_id)
+
+        engine.process_event({**event, 'transaction_id': 'txn_002'})
+        assert first['transaction_velocity_1h'] == 1
+        assert engine.get_features(user_id)['transaction_velocity_1h'] == 2
+
+    def test_cleanup_removes_idle_users_only(self):
+        """Test that cleanup drops users whose events have all aged out."""
+        store = StateStore(max_window_minutes=60)
+        now = time.time()
+        store.update_user_events('idle_user', {
+            'user_id': 'idle_user', 'transaction_id': 'txn_001',
+            'amount': 10.0, 'timestamp_unix': now - 2 * 3600
+        })
+        store.update_user_events('active_user', {
+            'user_id': 'active_user', 'transaction_id': 'txn_001',
+            'amount': 10.0, 'timestamp_unix': now
+        })
+
+        # Age the idle user; the entry pushed at insertion is now superseded
+        state = store.get_user_state('idle_user')
+        state.last_updated = state.created_at = now - 2 * 3600
+        store._push_expiry('idle_user', state.last_updated)
+
+        assert store.clear_old_entries() == 1
+        assert store.get_stats()['total_users'] == 1
+        assert len(store.get_recent_events('active_user')) == 1
+
+    def test_batch_scores_match_single_scores(self):
+        """Test that vectorized scoring agrees with per-transaction scoring."""
+        feature_dicts = [
+            {},
+            {'transaction_velocity_1h': 3, 'amount_zscore': 2.5, 'location_anomaly': 1},
+            {'transaction_velocity_1h': 1, 'time_pattern_score': 0.8,
+             'merchant_diversity': 0.5, 'payment_method_consistency': 1.0},
+            {'amount_zscore': 1e6},  # Saturates without overflowing
+        ]
+
+        scores = fraud_scores(feature_matrix(feature_dicts))
+        assert scores.shape == (4,)
+        assert scores[0] == 0.5
+        for features, score in zip(feature_dicts, scores):
+            assert score == pytest.approx(fraud_score(features), abs=1e-12)
+        assert fraud_scores(feature_matrix([])).shape == (0,)
+
+    def test_bulk_eviction_matches_incremental_eviction(self):
+        """Test that rebuilding after a long idle gap matches evicting one by one."""
+        buffer = EventBuffer()
+        bulk = WindowAggregate(buffer, window_minutes=60, bit=1)
+        incremental = WindowAggregate(buffer, window_minutes=60, bit=2)
+        for i in range(120):
+            seq = buffer.append(f'txn_{i:03d}', 10.0 + (i * 37) % 101, float(i),
+                                i % 24, i % 7, i % 5, i % 9, i % 3)
+            bulk.append(seq)
+            incremental.append(seq)
+
+        bulk.evict(99.5)
+        while incremental.count and buffer.timestamps[incremental.start - buffer.base] <= 99.5:
+            incremental.popleft()
+
+        assert (bulk.count, bulk.start, bulk.newest) == (20, 100, 119)
+        assert (bulk.start, bulk.newest) == (incremental.start, incremental.newest)
+        assert bulk.hour_counts == incremental.hour_counts
+        assert bulk.weekday_counts == incremental.weekday_counts
+        assert bulk.locations == incremental.locations
+        assert bulk.merchants == incremental.merchants
+        assert bulk.payment_methods == incremental.payment_methods
+        assert bulk.historical_amount_stats() == pytest.approx(incremental.historical_amount_stats())
+
+        bulk.evict(200.0)
+        assert bulk.count == 0 and not bulk.locations and sum(bulk.hour_counts) == 0
+
+    def test_event_buffers_share_arena_pages(self):
+        """Test that buffers carve their rows out of shared pages and free them for reuse."""
+        arena = EventArena(page_rows=64)
+        first = EventBuffer(max_events=20, arena=arena)
+        second = EventBuffer(max_events=20, arena=arena)
+        for i in range(30):
+            first.append(f'a_{i}', float(i), float(i), 0, 0, 1, 1, 1)
+            if len(first) > first.max_events:
+                first.popleft()
+            second.append(f'b_{i}', -float(i), float(i), 0, 0, 2, 2, 2)
+            if len(second) > second.max_events:
+                second.popleft()
+
+        pages = [page.amounts for page in arena.pages]
+        assert any(first.amounts is column for column in pages)
+        assert any(second.amounts is column for column in pages)
+        assert first.amounts[first.live_rows()].tolist() == [float(i) for i in range(10, 30)]
+        assert second.amounts[second.live_rows()].tolist() == [-float(i) for i in range(10, 30)]
+        assert 'a_29' in first and 'a_9' not in first and 'b_29' not in first
+
+        allocated = arena.allocated_rows
+        first.release()
+        third = EventBuffer(max_events=20, arena=arena)
+        for i in range(30):
+            third.append(f'c_{i}', 1.0, float(i), 0, 0, 0, 0, 0)
+            if len(third) > third.max_events:
+                third.popleft()
+        assert arena.allocated_rows == allocated  # Reused the released blocks
+        assert third.transaction_ids[third.live_rows()].tolist()[-1] == 'c_29'
+
+    def test_large_batch_matches_sequential_processing(self, engine, state_store):
+        """Test the column-wise batch path, including the per-user event cap."""
+        now = time.time()
+        events = []
+        for i in range(1200):
+            events.append({
+                'user_id': 'bulk_user',
+                'transaction_id': f'txn_{i:04d}',
+                'amount': 20.0 + (i * 37) % 400,
+                # Ten days of history, with one late arrival every 50 events
+                'timestamp_unix': now - 864000 + i * 700 + (-5000 if i % 50 == 0 else 30),
+                'merchant': f'Merchant {i % 11}',
+                'location': f'City {i % 4}',
+                'payment_method': 'credit_card' if i % 3 else 'debit_card'
+            })
+
+        sequential = RealTimeFeatureEngine(StateStore())
+        for event in events:
+            sequential.process_event(event)
+
+        assert engine.process_batch(events[:100]) is True
+        assert engine.process_batch(events[100:]) is True
+
+        assert engine.get_features('bulk_user') == pytest.approx(sequential.get_features('bulk_user'))
+        for window_minutes in (60, 1440, 10080, 42):
+            assert (state_store.get_recent_events('bulk_user', window_minutes) ==
+                    sequential.state_store.get_recent_events('bulk_user', window_minutes))
+
+    def test_process_events_returns_per_event_features(self, engine):
+        """Test that process_events yields each event's features as a matrix row."""
+        base_time = datetime.now(timezone.utc)
+        events = [
+            {
+                'user_id': 'matrix_user',
+                'transaction_id': f'txn_{i:03d}',
+                'amount': 100.0 if i < 4 else 1000.0,
+                'timestamp': (base_time + timedelta(seconds=i)).isoformat(),
+                'location': 'Test City'
+            }
+            for i in range(5)
+        ]
+        events.append({'transaction_id': 'txn_bad'})  # Missing user_id
+
+        sequential = RealTimeFeatureEngine(StateStore())
+        expected = []
+        for event in events[:-1]:
+            sequential.process_event(event)
+            expected.append(sequential.get_features('matrix_user'))
+
+        matrix = engine.process_events(events)
+        assert matrix.shape == (6, len(FEATURE_ORDER))
+        velocity = FEATURE_ORDER.index('transaction_velocity_1h')
+        assert matrix[:5, velocity].tolist() == [1, 2, 3, 4, 5]
+        for row, features in zip(fraud_scores(matrix[:5]), expected):
+            assert row == pytest.approx(fraud_score(features))
+        assert fraud_scores(matrix[5:])[0] == pytest.approx(fraud_score(engine.get_features('nobody')))
+
+    def test_sliding_moments_match_exact_statistics(self):
+        """Test two-stacks window moments against exact recomputation."""
+        rng = random.Random(7)
+        moments = SlidingMoments()
+        window = []
+        for _ in range(2000):
+            if window and rng.random() < 0.45:
+                moments.pop()
+                window.pop(0)
+            else:
+                value = rng.choice([rng.uniform(0, 10), rng.uniform(1e6, 1e9), 19.99])
+                moments.push(value)
+                window.append(value)
+
+            count, mean, m2 = moments.query()
+            assert count == len(window)
+            if window:
+                exact_mean = math.fsum(window) / len(window)
+                exact_m2 = math.fsum((value - exact_mean) ** 2 for value in window)
+                assert mean == pytest.approx(exact_mean, rel=1e-12)
+                assert m2 == pytest.approx(exact_m2, rel=1e-9, abs=0.0)
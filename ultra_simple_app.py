@@ -6,9 +6,26 @@ Streamlit application with minimal dependencies for guaranteed deployment
 
 import streamlit as st
 import random
+from bisect import bisect_left
 from datetime import datetime
 import time
 
+# Risk rules as lookup tables: each input maps to the score it adds
+BASE_RISK = 0.1
+AMOUNT_BINS = (200, 500)  # Amounts up to 200 are low, up to 500 medium, above that high
+AMOUNT_RISK = (0.0, 0.2, 0.4)
+AMOUNT_LEVELS = ("Low", "Medium", "High")
+MERCHANT_RISK = {"Amazon": 0.0, "Walmart": 0.0, "Starbucks": 0.0, "Target": 0.0, "Unknown": 0.25}
+LOCATION_RISK = {"New York": 0.0, "Los Angeles": 0.0, "Chicago": 0.0, "Houston": 0.0, "Miami": 0.0, "Unknown": 0.3}
+PAYMENT_RISK = {"credit_card": 0.0, "debit_card": 0.0, "paypal": 0.1, "apple_pay": 0.0}
+HOUR_RISK = tuple(0.15 if hour < 6 or hour > 22 else 0.0 for hour in range(24))  # Unusual hours
+
+# Widget choices, built once rather than on every rerun
+PAGES = ("Overview", "Fraud Detection", "About")
+MERCHANTS = tuple(MERCHANT_RISK)
+LOCATIONS = tuple(LOCATION_RISK)
+PAYMENTS = tuple(PAYMENT_RISK)
+
 # Page config
 st.set_page_config(page_title="🛡️ Fraud Detection Demo", page_icon="🛡️")
 
@@ -18,7 +35,7 @@ st.markdown("### Ultra Simple Version - Minimal Dependencies")
 
 # Sidebar
 st.sidebar.header("🎯 Controls")
-page = st.sidebar.radio("Choose a page:", ["Overview", "Fraud Detection", "About"])
+page = st.sidebar.radio("Choose a page:", PAGES, key="page")
 
 if page == "Overview":
     st.header("📊 Dashboard Overview")
@@ -47,38 +64,25 @@ elif page == "Fraud Detection":
     with st.form("fraud_check"):
         user_id = st.text_input("User ID", value="user_123", help="Unique user identifier")
         amount = st.number_input("Amount ($)", min_value=0.01, value=150.00, step=0.01)
-        merchant = st.selectbox("Merchant", ["Amazon", "Walmart", "Starbucks", "Target", "Unknown"])
-        location = st.selectbox("Location", ["New York", "Los Angeles", "Chicago", "Houston", "Miami", "Unknown"])
-        payment_method = st.selectbox("Payment Method", ["credit_card", "debit_card", "paypal", "apple_pay"])
+        merchant = st.selectbox("Merchant", MERCHANTS, key="merchant")
+        location = st.selectbox("Location", LOCATIONS, key="location")
+        payment_method = st.selectbox("Payment Method", PAYMENTS, key="payment_method")
 
         submitted = st.form_submit_button("🔍 Analyze Transaction")
 
         if submitted:
-            # Simple fraud detection logic (no complex dependencies)
-            risk_score = 0.1  # Base low risk
-
-            # Amount-based risk
-            if amount > 500:
-                risk_score += 0.4
-            elif amount > 200:
-                risk_score += 0.2
-
-            # Location-based risk
-            if location == "Unknown":
-                risk_score += 0.3
-
-            # Merchant-based risk
-            if merchant == "Unknown":
-                risk_score += 0.25
-
-            # Time-based risk (simple approximation)
+            # Simple fraud detection logic (no complex dependencies):
+            # base low risk plus each factor's contribution from the tables
+            amount_level = bisect_left(AMOUNT_BINS, amount)
             current_hour = datetime.now().hour
-            if current_hour < 6 or current_hour > 22:  # Unusual hours
-                risk_score += 0.15
-
-            # Payment method consistency (simplified)
-            if payment_method == "paypal":
-                risk_score += 0.1
+            risk_score = (
+                BASE_RISK
+                + AMOUNT_RISK[amount_level]
+                + LOCATION_RISK[location]
+                + MERCHANT_RISK[merchant]
+                + HOUR_RISK[current_hour]
+                + PAYMENT_RISK[payment_method]
+            )
 
             # Add some randomness
             risk_score += random.uniform(-0.1, 0.1)
@@ -124,10 +128,10 @@ elif page == "Fraud Detection":
             st.subheader("🔍 Risk Factors Analyzed")
 
             factors = {
-                "Transaction Amount": f"${amount:.2f} ({'High' if amount > 500 else 'Medium' if amount > 200 else 'Low'})",
-                "Location": f"{location} ({'Suspicious' if location == 'Unknown' else 'Normal'})",
-                "Merchant": f"{merchant} ({'Suspicious' if merchant == 'Unknown' else 'Known'})",
-                "Time": f"{current_hour}:00 ({'Unusual' if current_hour < 6 or current_hour > 22 else 'Normal'})",
+                "Transaction Amount": f"${amount:.2f} ({AMOUNT_LEVELS[amount_level]})",
+                "Location": f"{location} ({'Suspicious' if LOCATION_RISK[location] else 'Normal'})",
+                "Merchant": f"{merchant} ({'Suspicious' if MERCHANT_RISK[merchant] else 'Known'})",
+                "Time": f"{current_hour}:00 ({'Unusual' if HOUR_RISK[current_hour] else 'Normal'})",
                 "Payment Method": payment_method
             }
 